@@ -1,29 +1,290 @@
-from flask import Flask, render_template, request, url_for
-from werkzeug.utils import secure_filename
+from flask import Flask, Response, abort, g, jsonify, render_template, request, send_file, stream_with_context, url_for
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import atexit
+import json
 import os
-from face_analyzer import brutal_report
+import sys
+import threading
+import time
+import metrics
+from cache import ResultCache, cache_key
+from jobs import JobQueue, QueueFull
+from population import Population
+from previews import Previews
+from upload_store import UploadStore
+from face_analyzer import (
+    MAX_FACES, AnalysisError, FaceScore, ImageTooLarge, config as analyzer_config, content_hash, detect, format_report,
+    score_landmarks, start_pool, use_landmark_store, warm_up
+)
 
 app = Flask(__name__)
-UPLOAD_FOLDER = Path("static/uploads")
+# not under static/: uploads are only served as previews, through /preview
+UPLOAD_FOLDER = Path("uploads")
 UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
 app.config["UPLOAD_FOLDER"] = str(UPLOAD_FOLDER)
+# inference worker processes; unset = one per core, 0 = run in the request thread
+WORKERS = int(os.environ.get("EROS_WORKERS", os.cpu_count() or 1))
+# keeping the upload only matters for the preview on the result page, so it's written
+# in the background after the analysis instead of on the request path
+SAVE_UPLOADS = os.environ.get("EROS_SAVE_UPLOADS", "1") != "0"
+_saver = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload-saver")
+_started = False
+_startup_lock = threading.Lock()
+# uploads are stored once per distinct image, within a disk budget
+uploads = UploadStore(
+    UPLOAD_FOLDER,
+    max_bytes=int(float(os.environ.get("EROS_UPLOAD_BUDGET_MB", "1024")) * (1 << 20)),
+    ttl=float(os.environ.get("EROS_UPLOAD_TTL_DAYS", "0")) * 86400 or None,
+)
+# repeat uploads skip decode + inference; set EROS_CACHE_DB to keep results across restarts
+cache = ResultCache(
+    max_items=int(os.environ.get("EROS_CACHE_SIZE", "512")),
+    path=os.environ.get("EROS_CACHE_DB"),
+    ttl=float(os.environ.get("EROS_CACHE_TTL", "0")) or None,
+    max_rows=int(os.environ.get("EROS_CACHE_DB_ROWS", "100000")),
+)
+# keep every analyzed face's landmarks so scoring changes can be replayed without inference
+landmark_store = None
+if os.environ.get("EROS_LANDMARK_STORE"):
+    from landmark_store import LandmarkStore
+    landmark_store = LandmarkStore(os.environ["EROS_LANDMARK_STORE"])
+    use_landmark_store(landmark_store)
+# uploads still waiting for the background save are served from memory
+_unsaved = {}
+
+def _save_upload(image_hash, data):
+    _unsaved[image_hash] = data
+    def save():
+        try: uploads.put(image_hash, data)
+        finally: _unsaved.pop(image_hash, None)
+    _saver.submit(save)
+
+def _upload_bytes(image_hash):
+    data = _unsaved.get(image_hash)
+    if data is not None: return data
+    path = uploads.get(image_hash)
+    try: return path.read_bytes() if path else None
+    except OSError: return None
+
+# rendered previews and overlays, private like the uploads and under their own disk budget
+previews = Previews(UPLOAD_FOLDER / "previews", _upload_bytes, landmark_store,
+                    max_bytes=int(float(os.environ.get("EROS_PREVIEW_BUDGET_MB", "256")) * (1 << 20)))
+# running score distribution for "better than X%" answers; EROS_POPULATION keeps it on disk
+population = Population(os.environ.get("EROS_POPULATION"))
+_since_snapshot = 0
+# similarity index built with `python similar.py build`; new uploads are added as they're searched
+similar_index = None
+if os.environ.get("EROS_GEOMETRY_INDEX") and os.path.exists(os.environ["EROS_GEOMETRY_INDEX"]):
+    from similar import GeometryIndex
+    similar_index = GeometryIndex.load(os.environ["EROS_GEOMETRY_INDEX"])
+    atexit.register(similar_index.save, os.environ["EROS_GEOMETRY_INDEX"])
+# threads that fan a batch out to the inference workers
+_fanout = ThreadPoolExecutor(max_workers=max(4, 2 * WORKERS), thread_name_prefix="api-fanout")
+
+def analyze_upload(data: bytes, max_faces=None) -> dict:
+    # json-ready result for these bytes, straight from the cache if we've seen them before.
+    # with max_faces every detected face is scored and returned under "faces"
+    key = cache_key(data, analyzer_config(max_faces=max_faces))
+    result = cache.get(key)
+    if result is None:
+        try:
+            pts, w, h = detect(data, max_faces or 1)
+            previews.remember(content_hash(data), pts, w, h)
+            faces = score_landmarks(pts, w, h, own_midline=bool(max_faces))
+            result = {"faces": [f.to_dict() for f in faces]} if max_faces else faces[0].to_dict()
+        # refused before decoding: nothing to preview, and not worth keeping on disk
+        except ImageTooLarge as e: result = {"error": str(e), "too_large": True}
+        except AnalysisError as e: result = {"error": str(e)}
+        cache.put(key, result)
+        # multi-face totals use the per-face midline (geometry.FACE_PROFILE), a different
+        # definition of "total", so only default results go into the distribution rank() reads
+        if max_faces is None: _count_in_population(result)
+    return result
+
+def analyze_captured(data: bytes, max_faces=None):
+    # analyze_upload on some other thread, plus the metrics events it recorded there, for
+    # the Server-Timing header of the request that asked
+    with metrics.capture() as events:
+        return analyze_upload(data, max_faces), events
+
+def _count_in_population(result):
+    # only fresh results count, so re-uploads of the same photo aren't counted twice
+    global _since_snapshot
+    if "total" in result: population.add(result)
+    _since_snapshot += 1
+    if population.path and _since_snapshot >= 50:
+        _since_snapshot = 0
+        _saver.submit(population.snapshot)
+
+def rank(result: dict):
+    # percentile of the overall score, None until there's a population to compare with
+    return population.percentile("total", result["total"]) if "total" in result else None
+
+# async submissions: a bounded queue in front of the analyzers, full queue -> 503
+jobs = JobQueue(
+    analyze_upload,
+    workers=max(1, WORKERS),
+    max_pending=int(os.environ.get("EROS_QUEUE_SIZE", "64")),
+)
+
+# adds a Server-Timing header with the per-stage breakdown of each request
+SERVER_TIMING = os.environ.get("EROS_SERVER_TIMING", "1") != "0"
+
+metrics.gauge("eros_cache_hits_total", "Result cache hits.", lambda: cache.hits, "counter")
+metrics.gauge("eros_cache_misses_total", "Result cache misses.", lambda: cache.misses, "counter")
+metrics.gauge("eros_cache_items", "Results held in the in-memory cache tier.", lambda: len(cache._mem))
+metrics.gauge("eros_upload_bytes", "Disk used by stored uploads.", lambda: uploads.total_bytes())
+metrics.gauge("eros_jobs_pending", "Async jobs waiting for a worker.", lambda: jobs.stats()["pending"])
+metrics.gauge("eros_pool_workers", "Inference worker processes.", lambda: WORKERS)
+
+def startup():
+    # start the inference pool (or warm up in-process) once per serving process, before it
+    # takes traffic: from gunicorn.conf.py's post_worker_init, the dev server's main block
+    # and the asgi lifespan. other wsgi servers get it on the first request
+    global _started
+    with _startup_lock:
+        if _started: return
+        if WORKERS: start_pool(WORKERS)
+        else: warm_up()
+        _started = True
+
+@app.before_request
+def _start_timing():
+    g.started = time.perf_counter()
+    g.events = metrics.start_capture()
+
+@app.before_request
+def _ensure_started():
+    if not _started: startup()
+
+@app.teardown_request
+def _stop_timing(exc):
+    if "events" in g: metrics.stop_capture(g.events)
+
+@app.after_request
+def _finish_timing(resp):
+    if "started" not in g: return resp  # a before_request hook failed ahead of us
+    metrics.observe("eros_request_seconds", time.perf_counter() - g.started, endpoint=request.endpoint or "none")
+    if SERVER_TIMING and g.events:
+        resp.headers["Server-Timing"] = metrics.server_timing(g.events)
+    return resp
+
+def render_report(result: dict) -> str:
+    if "error" in result: return f"❌ {result['error']}"
+    with metrics.timed("report"): return format_report(FaceScore(**result))
+
+def result_page(data: bytes, result: dict) -> str:
+    report = render_report(result)
+    image = None
+    if SAVE_UPLOADS and not result.get("too_large"):
+        image_hash = content_hash(data)
+        _save_upload(image_hash, data)
+        kind = "overlay" if "error" not in result and previews.has_overlay(image_hash) else "thumb"
+        image = url_for("preview", image_hash=image_hash, kind=kind)
+    with metrics.timed("render"):
+        return render_template("result.html", report=report, image=image, rank=rank(result))
 
 @app.route("/", methods=["GET", "POST"])
 def index():
     if request.method == "POST":
         file = request.files.get("image")
         if file and file.filename:
-            filename = secure_filename(file.filename)
-            path = UPLOAD_FOLDER / filename
-            file.save(path)
-            report = brutal_report(path)
-            return render_template(
-                "result.html",
-                report=report,
-                image=url_for("static", filename=f"uploads/{filename}")
-            )
+            data = file.read()
+            return result_page(data, analyze_upload(data))
     return render_template("index.html")
 
+@app.route("/preview/<image_hash>/<kind>.jpg")
+def preview(image_hash, kind):
+    # downscaled upload ("thumb") or the same with the landmarks drawn on ("overlay")
+    if kind not in ("thumb", "overlay") or len(image_hash) != 64: abort(404)
+    path = previews.path(image_hash, kind)
+    if path is None or not path.exists(): abort(404)
+    # the url is the content hash, so the file never changes
+    resp = send_file(path, mimetype="image/jpeg", max_age=31536000, conditional=True)
+    resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return resp
+
+@app.route("/api/analyze", methods=["POST"])
+def api_analyze():
+    # any number of images in one multipart request (field "images" or "image"),
+    # answered with one json object per image in upload order. ?max_faces=N scores
+    # up to N faces per image
+    files = request.files.getlist("images") + request.files.getlist("image")
+    if not files: return jsonify({"error": "No images uploaded."}), 400
+    max_faces = request.args.get("max_faces", type=int)
+    if max_faces is not None: max_faces = max(1, min(max_faces, MAX_FACES))
+    names = [f.filename for f in files]
+    results = []
+    for result, events in _fanout.map(lambda data: analyze_captured(data, max_faces), [f.read() for f in files]):
+        g.events.extend(events)  # captures are per thread; bring the fan-out's stages home
+        results.append(result)
+    return jsonify([{"filename": n, **r, "percentile": rank(r)} for n, r in zip(names, results)])
+
+@app.route("/api/similar", methods=["POST"])
+def api_similar():
+    # the stored faces whose geometry is closest to the uploaded one (?k=, default 5)
+    if similar_index is None: return jsonify({"error": "No similarity index loaded."}), 503
+    file = request.files.get("image")
+    if not file: return jsonify({"error": "No image uploaded."}), 400
+    data = file.read()
+    try: pts, _, _ = detect(data)
+    except AnalysisError as e: return jsonify({"error": str(e)}), 422
+    k = max(1, min(request.args.get("k", 5, type=int), 50))
+    matches = similar_index.query(pts[:1], k)
+    similar_index.add([f"{content_hash(data)}:0"], pts[:1])
+    return jsonify([{"id": i, "distance": d} for i, d in matches])
+
+@app.route("/api/jobs", methods=["POST"])
+def submit_job():
+    file = request.files.get("image")
+    if not file: return jsonify({"error": "No image uploaded."}), 400
+    try: job = jobs.submit(file.read())
+    except QueueFull:
+        resp = jsonify({"error": "Too busy, try again shortly."})
+        resp.status_code = 503
+        resp.headers["Retry-After"] = str(jobs.retry_after())
+        return resp
+    return jsonify({"id": job.id, "status": job.status,
+                    "poll": url_for("job_status", job_id=job.id),
+                    "events": url_for("job_events", job_id=job.id)}), 202
+
+@app.route("/api/jobs/<job_id>")
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None: return jsonify({"error": "Unknown job."}), 404
+    return jsonify(job.to_dict())
+
+@app.route("/api/jobs/<job_id>/events")
+def job_events(job_id):
+    # server-sent events: a keep-alive comment every 15s, then one "done" event with the result
+    job = jobs.get(job_id)
+    if job is None: return jsonify({"error": "Unknown job."}), 404
+    def stream():
+        while not job.done.wait(15):
+            yield ": waiting\n\n"
+        yield f"event: done\ndata: {json.dumps(job.to_dict())}\n\n"
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache"})
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/cache")
+def cache_stats():
+    return jsonify(cache.stats())
+
+if population.path:
+    atexit.register(population.snapshot)
+
 if __name__ == "__main__":
+    if "--asgi" in sys.argv[1:]:
+        # async front end (asgi.py) around this same app; it imports us as "app"
+        sys.modules.setdefault("app", sys.modules[__name__])
+        import asgi
+        asgi.main([a for a in sys.argv[1:] if a != "--asgi"])
+        sys.exit()
+    # with debug on, the reloader re-runs this file in a child and only that one serves
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true": startup()
     app.run(debug=True)
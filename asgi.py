@@ -0,0 +1,92 @@
+# async serving mode: python app.py --asgi  (or: uvicorn asgi:app)
+# needs starlette, python-multipart and uvicorn. uploads are received and buffered on the
+# event loop and only the analysis itself goes to the executor, so thousands of slow or
+# idle connections share a handful of inference workers instead of holding a thread each.
+# routes without heavy work (previews, metrics, jobs, ...) are served by the flask app
+
+import argparse
+import asyncio
+import contextlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import HTMLResponse, JSONResponse
+from starlette.routing import Mount, Route
+
+import app as web
+import metrics
+from face_analyzer import MAX_FACES
+
+# threads that hand analyses to the worker pool (or run them, without one)
+_executor = ThreadPoolExecutor(max_workers=max(4, 2 * web.WORKERS), thread_name_prefix="asgi-infer")
+
+
+async def _analyze(data, max_faces=None):
+    # (result, metrics events recorded for it on the executor thread)
+    return await asyncio.get_running_loop().run_in_executor(_executor, web.analyze_captured, data, max_faces)
+
+def _timing_headers(events):
+    return {"Server-Timing": metrics.server_timing(events)} if web.SERVER_TIMING and events else None
+
+def _flask(fn, *args):
+    # flask templates and url_for need a request context
+    with web.app.test_request_context("/"):
+        return fn(*args)
+
+async def index(request):
+    start = time.perf_counter()
+    form = await request.form()
+    upload = form.get("image")
+    if upload is None or not getattr(upload, "filename", None):
+        return HTMLResponse(_flask(web.render_template, "index.html"))
+    data = await upload.read()
+    result, events = await _analyze(data)
+    # no await inside, so this capture only sees this request's report/render stages
+    with metrics.capture() as page_events:
+        html = _flask(web.result_page, data, result)
+    metrics.observe("eros_request_seconds", time.perf_counter() - start, endpoint="index")
+    return HTMLResponse(html, headers=_timing_headers(events + page_events))
+
+async def api_analyze(request):
+    start = time.perf_counter()
+    form = await request.form()
+    files = form.getlist("images") + form.getlist("image")
+    if not files: return JSONResponse({"error": "No images uploaded."}, 400)
+    max_faces = request.query_params.get("max_faces")
+    max_faces = max(1, min(int(max_faces), MAX_FACES)) if max_faces and max_faces.isdigit() else None
+    datas = [await f.read() for f in files]
+    done = await asyncio.gather(*(_analyze(d, max_faces) for d in datas))
+    metrics.observe("eros_request_seconds", time.perf_counter() - start, endpoint="api_analyze")
+    return JSONResponse([{"filename": f.filename, **r, "percentile": web.rank(r)} for f, (r, _) in zip(files, done)],
+                        headers=_timing_headers([e for _, events in done for e in events]))
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_):
+    # workers are up and warm before the server accepts connections
+    web.startup()
+    yield
+
+app = Starlette(
+    routes=[
+        Route("/", index, methods=["POST"]),
+        Route("/api/analyze", api_analyze, methods=["POST"]),
+        Mount("/", app=WSGIMiddleware(web.app)),
+    ],
+    lifespan=lifespan,
+)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Serve Eros with the async front end.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=5000)
+    args = ap.parse_args(argv)
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# batch scoring for big photo folders: python batch.py photos/ -o results.jsonl
+# results are streamed as they finish (jsonl or csv, picked from the -o extension)
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from dataclasses import fields
+from pathlib import Path
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+
+
+def find_images(paths):
+    for p in map(Path, paths):
+        if p.is_file():
+            yield p
+            continue
+        for root, dirs, files in os.walk(p):
+            dirs.sort()
+            for name in sorted(files):
+                if Path(name).suffix.lower() in IMAGE_EXTS:
+                    yield Path(root) / name
+
+def score_file(path, max_side=None):
+    # runs inside a pool worker: the file is read there, only the result row and the
+    # landmarks (for --store) come back
+    from face_analyzer import AnalysisError, _detect, content_hash, score_landmarks
+    try:
+        data = Path(path).read_bytes()
+        pts, w, h = _detect(data, max_side)
+        return {"path": path, **score_landmarks(pts, w, h)[0].to_dict()}, (content_hash(data), pts, w, h)
+    except OSError:
+        return {"path": path, "error": "Can't read image."}, None
+    except AnalysisError as e:
+        return {"path": path, "error": str(e)}, None
+    except Exception as e:
+        # one bad file gets an error row instead of ending the run
+        return {"path": path, "error": f"{type(e).__name__}: {e}"}, None
+
+
+class JsonlWriter:
+    def __init__(self, f): self.f = f
+    def write(self, row):
+        self.f.write(json.dumps(row) + "\n")
+        self.f.flush()
+
+class CsvWriter:
+    def __init__(self, f):
+        from face_analyzer import FaceScore
+        self.f = f
+        self.w = csv.DictWriter(f, ["path", *(x.name for x in fields(FaceScore)), "error"], extrasaction="ignore")
+        self.w.writeheader()
+    def write(self, row):
+        self.w.writerow(row)
+        self.f.flush()
+
+
+def progress(done, total, failed, start):
+    elapsed = time.perf_counter() - start
+    rate = done / elapsed if elapsed else 0.0
+    eta = (total - done) / rate if rate else 0.0
+    sys.stderr.write(f"\r{done}/{total} done, {failed} failed, {rate:.1f} img/s, "
+                     f"ETA {int(eta // 60):02d}:{int(eta % 60):02d} ")
+    sys.stderr.flush()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Score every face photo under the given folders.")
+    ap.add_argument("paths", nargs="+", help="image files or folders (searched recursively)")
+    ap.add_argument("-o", "--out", default="-", help="output file, .csv for csv, anything else is jsonl (default: stdout)")
+    ap.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="worker processes, one FaceMesh each")
+    ap.add_argument("--max-side", type=int, default=None, help="longest side fed to FaceMesh (default EROS_MAX_SIDE)")
+    ap.add_argument("--store", help="also keep every face's landmarks in this landmark store folder")
+    args = ap.parse_args(argv)
+
+    from mesh_pool import MeshPool
+
+    images = [str(p) for p in find_images(args.paths)]
+    if not images:
+        sys.exit("no images found")
+    out = sys.stdout if args.out == "-" else open(args.out, "w", newline="")
+    writer = CsvWriter(out) if args.out.endswith(".csv") else JsonlWriter(out)
+
+    store = None
+    if args.store:
+        from landmark_store import LandmarkStore
+        store = LandmarkStore(args.store)
+
+    pool = MeshPool(args.workers)
+    todo = iter(images)
+    pending = set()
+    done = failed = 0
+    start = last = time.perf_counter()
+    try:
+        while True:
+            # keep a few jobs per worker in flight instead of queueing the whole corpus
+            while len(pending) < 4 * pool.workers:
+                path = next(todo, None)
+                if path is None: break
+                pending.add(pool.submit(score_file, path, args.max_side))
+            if not pending: break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in finished:
+                row, found = f.result()
+                failed += "error" in row
+                if store is not None and found is not None: store.add(*found)
+                writer.write(row)
+            done += len(finished)
+            if time.perf_counter() - last > 0.5 or not pending:
+                progress(done, len(images), failed, start)
+                last = time.perf_counter()
+    finally:
+        pool.close()
+        if out is not sys.stdout: out.close()
+    sys.stderr.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# stage-by-stage timing of the analysis pipeline
+#   python bench.py --save bench_baseline.json
+#   python bench.py --compare bench_baseline.json --threshold 0.25   (exit 1 on regression)
+#
+# every sample image is re-encoded at each size on the ladder, then each stage of
+# the pipeline is timed separately: decode, color conversion, FaceMesh, landmark
+# extraction, geometry/scoring and report formatting. a second, traced pass records
+# the peak memory each stage allocates
+
+import argparse
+import glob
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import face_analyzer as fa
+from geometry import landmarks_array, score_faces
+
+SOURCES = ["static/uploads/*.jpg", "test_programs/examples/*.jpg"]
+STAGES = ["decode", "color", "inference", "landmarks", "geometry", "report"]
+
+
+def size_ladder(sides):
+    # {label: [jpeg bytes, ...]} with every source image scaled to each long side ("orig" = as is)
+    import cv2
+    ladder = {}
+    paths = sorted(p for pattern in SOURCES for p in glob.glob(pattern))
+    for path in paths:
+        img = cv2.imread(path)
+        if img is None: continue
+        h, w = img.shape[:2]
+        for side in sides:
+            if side == "orig":
+                ladder.setdefault("orig", []).append(open(path, "rb").read())
+                continue
+            s = int(side) / max(h, w)
+            if s > 1: continue
+            small = cv2.resize(img, (round(w*s), round(h*s)), interpolation=cv2.INTER_AREA)
+            ladder.setdefault(str(side), []).append(cv2.imencode(".jpg", small, [cv2.IMWRITE_JPEG_QUALITY, 92])[1].tobytes())
+    return ladder
+
+def run_once(data, clock):
+    # one trip through the pipeline; clock(stage) is called after each stage finishes
+    img, w, h = fa.load_image(data)
+    clock("decode")
+    rgb = fa._rgb(img)
+    clock("color")
+    mesh, lock = fa._mesh(1)
+    with lock: res = mesh.process(rgb)
+    clock("inference")
+    if not res.multi_face_landmarks: return False
+    pts = landmarks_array(res.multi_face_landmarks[0], w, h)
+    clock("landmarks")
+    m = score_faces(pts, w)
+    score = fa.FaceScore(**{k: float(v) for k, v in m.items()})
+    clock("geometry")
+    fa.format_report(score)
+    clock("report")
+    return True
+
+def time_stages(images, repeat):
+    samples = {s: [] for s in STAGES}
+    for data in images:
+        for _ in range(repeat):
+            last = [time.perf_counter()]
+            def clock(stage):
+                now = time.perf_counter()
+                samples[stage].append((now - last[0]) * 1000)
+                last[0] = now
+            run_once(data, clock)
+    return samples
+
+def peak_memory(images):
+    peaks = {s: 0 for s in STAGES}
+    tracemalloc.start()
+    try:
+        for data in images:
+            tracemalloc.reset_peak()
+            def clock(stage):
+                peaks[stage] = max(peaks[stage], tracemalloc.get_traced_memory()[1])
+                tracemalloc.reset_peak()
+            run_once(data, clock)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+def bench(sides, repeat):
+    fa.warm_up()
+    results = {}
+    for label, images in size_ladder(sides).items():
+        samples = time_stages(images, repeat)
+        peaks = peak_memory(images)
+        results[label] = {
+            stage: {
+                "n": len(samples[stage]),
+                "p50_ms": float(np.percentile(samples[stage], 50)) if samples[stage] else None,
+                "p95_ms": float(np.percentile(samples[stage], 95)) if samples[stage] else None,
+                "peak_kb": peaks[stage] / 1024,
+            }
+            for stage in STAGES
+        }
+    return results
+
+def regressions(results, baseline, threshold):
+    out = []
+    for label, stages in results.items():
+        for stage, r in stages.items():
+            old = baseline.get(label, {}).get(stage, {}).get("p50_ms")
+            new = r["p50_ms"]
+            if old and new and new > old * (1 + threshold):
+                out.append(f"{label}/{stage}: p50 {old:.2f} -> {new:.2f} ms (+{(new / old - 1) * 100:.0f}%)")
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Time each stage of the analysis pipeline.")
+    ap.add_argument("--sides", default="480,960,1920,orig", help="size ladder, long side in px or 'orig'")
+    ap.add_argument("--repeat", type=int, default=5, help="runs per image and size")
+    ap.add_argument("--save", help="write the results as a json baseline")
+    ap.add_argument("--compare", help="baseline json to check against")
+    ap.add_argument("--threshold", type=float, default=0.25, help="allowed p50 slowdown before failing (0.25 = 25%%)")
+    args = ap.parse_args(argv)
+
+    results = bench(args.sides.split(","), args.repeat)
+    for label, stages in results.items():
+        print(f"[{label}]")
+        for stage, r in stages.items():
+            if r["p50_ms"] is None: continue
+            print(f"  {stage:<10} p50 {r['p50_ms']:8.2f} ms   p95 {r['p95_ms']:8.2f} ms   peak {r['peak_kb']:9.0f} KB")
+    if args.save:
+        with open(args.save, "w") as f: json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f: slow = regressions(results, json.load(f), args.threshold)
+        for line in slow: print("REGRESSION", line)
+        if slow: sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def cache_key(data: bytes, config: dict) -> str:
+    # same bytes analyzed with the same settings always give the same result
+    h = hashlib.sha256(data)
+    h.update(json.dumps(config, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+class ResultCache:
+    # bounded in-process LRU, optionally backed by a sqlite file that survives restarts.
+    # values must be json-serializable; ttl (seconds) applies to both tiers. expired sqlite
+    # rows, and the oldest beyond max_rows, are deleted at startup and every EVICT_EVERY writes
+    EVICT_EVERY = 256
+
+    def __init__(self, max_items=512, path=None, ttl=None, max_rows=None):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.hits = self.disk_hits = self.misses = 0
+        self._writes = 0
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, created REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created)")
+            self.evict_expired()
+
+    def _fresh(self, created):
+        return self.ttl is None or time.time() - created < self.ttl
+
+    def get(self, key):
+        with self._lock:
+            item = self._mem.get(key)
+            if item is not None and self._fresh(item[0]):
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            self._mem.pop(key, None)
+            if self._db is not None:
+                row = self._db.execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+                if row and self._fresh(row[1]):
+                    value = json.loads(row[0])
+                    self._remember(key, value, row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (key, json.dumps(value), now))
+                self._writes += 1
+            evict = self._writes >= self.EVICT_EVERY
+            if evict: self._writes = 0
+        if evict: self.evict_expired()
+
+    def _remember(self, key, value, created):
+        self._mem[key] = (created, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_items:
+            self._mem.popitem(last=False)
+
+    def evict_expired(self):
+        if self._db is None: return
+        with self._lock:
+            if self.ttl is not None:
+                self._db.execute("DELETE FROM results WHERE created < ?", (time.time() - self.ttl,))
+            if self.max_rows:
+                self._db.execute("DELETE FROM results WHERE key IN "
+                                 "(SELECT key FROM results ORDER BY created DESC LIMIT -1 OFFSET ?)", (self.max_rows,))
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0, "size": len(self._mem),
+        }
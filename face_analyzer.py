@@ -1,64 +1,391 @@
-import cv2
-import mediapipe as mp
+import hashlib
+import os
+import struct
+import threading
+import tracemalloc
+from contextlib import contextmanager
 import numpy as np
+from dataclasses import asdict, dataclass
 from pathlib import Path
+from geometry import L, landmarks_array, ratio_score, score_faces
+from metrics import count, observe, timed
+from quality import QualityConfig, check as quality_check
 
-mp_face_mesh = mp.solutions.face_mesh
-face_mesh = mp_face_mesh.FaceMesh(
-    static_image_mode=True,
-    max_num_faces=1,
-    refine_landmarks=True,
-    min_detection_confidence=0.7
-)
-
-def dist(a,b): return np.linalg.norm(np.array(a)-np.array(b))
-def ratio_score(actual, ideal):
-    # harsher scoring: tiny deviations drop points fast
-    dev = abs(actual - ideal) / ideal
-    if dev <= 0.05: return 10
-    if dev <= 0.2:  return 10 * (0.2 - dev) / 0.15
-    return 0
-
-L = {"top":10,"brow":9,"nose":2,"chin":152,"left":234,"right":454,
-     "eyeL":133,"eyeR":362,"noseL":98,"noseR":327,
-     "lipU":13,"lipM":14,"lipL":17}
-
-def brutal_report(img_path: Path) -> str:
-    img = cv2.imread(str(img_path))
-    if img is None: return "❌ Can't read image."
-    h,w,_ = img.shape
-    res = face_mesh.process(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-    if not res.multi_face_landmarks: return "❌ No face detected."
-
-    pts = [(lm.x*w, lm.y*h) for lm in res.multi_face_landmarks[0].landmark]
-    p=lambda i: pts[i]
-
-    thirds = [dist(p(L["top"]),p(L["brow"])),
-              dist(p(L["brow"]),p(L["nose"])),
-              dist(p(L["nose"]),p(L["chin"]))]
-    w_face = dist(p(L["left"]),p(L["right"]))
-    l_face = dist(p(L["top"]),p(L["chin"]))
-    nose_w = dist(p(L["noseL"]),p(L["noseR"]))
-    upper_lip = dist(p(L["lipU"]),p(L["lipM"]))
-    lower_lip = dist(p(L["lipM"]),p(L["lipL"]))
-
-    thirds_dev = np.mean([abs(x - np.mean(thirds)) / np.mean(thirds) for x in thirds])
-    thirds_score = max(0, 20 * (1 - thirds_dev*2))  # harsher
-    ratio = l_face / w_face
-    face_score = ratio_score(ratio, 1.618) * 5
-    sym = 1 - abs((p(L["eyeL"])[0]+p(L["eyeR"])[0])-w)/w
-    sym_score = sym * 25
-    nose_score = ratio_score(nose_w / w_face, 0.28) * 5
-    lip_score = ratio_score(upper_lip/(lower_lip+1e-6), 1/1.6) * 5
-    total = np.clip(thirds_score+face_score+sym_score+nose_score+lip_score,0,100)
+# cv2 and mediapipe are imported on first use: the geometry/scoring side, the app's
+# startup and CLI --help never pay for them, and forked workers build their own graphs.
+# call warm_up() before taking traffic so the first request doesn't pay either
 
+# the face limit is baked into a graph when it's built, so there's one graph per limit.
+# each has a lock: a graph must not be fed from two threads at once (the pool avoids
+# this by giving each worker its own)
+MAX_FACES = 10
+_meshes = {}
+_meshes_lock = threading.Lock()
+
+def _mesh(max_faces=1):
+    with _meshes_lock:
+        if max_faces not in _meshes:
+            import mediapipe as mp
+            _meshes[max_faces] = (mp.solutions.face_mesh.FaceMesh(
+                static_image_mode=True,
+                max_num_faces=max_faces,
+                refine_landmarks=True,
+                min_detection_confidence=0.7
+            ), threading.Lock())
+        return _meshes[max_faces]
+
+def __getattr__(name):
+    # old module-level graph, now built when first asked for
+    if name == "face_mesh": return _mesh(1)[0]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# longest side fed to FaceMesh; it resizes internally anyway, so decoding more is wasted work (0 = off)
+# capping isn't free: landmarks shift slightly, and on the sample images the overall score moves
+# by up to 1.5 points at 1280 and 2.2 at 640 against a full-size decode.
+# test_programs/resolution_parity.py fails above 2.0 / 3.0
+MAX_SIDE = int(os.environ.get("EROS_MAX_SIDE", "1280"))
+# detector-then-mesh cascade: a cheap face detector on a small copy finds the faces, then
+# FaceMesh only sees a padded crop around each one, taken from an image decoded up to
+# CASCADE_MAX_SIDE. no face in the cheap stage means no mesh work at all. FaceMesh sees a
+# different framing, so scores drift more than with MAX_SIDE alone: up to 4 points on the
+# sample images (test_programs/resolution_parity.py allows 5)
+CASCADE = os.environ.get("EROS_CASCADE", "0") == "1"
+CASCADE_MAX_SIDE = int(os.environ.get("EROS_CASCADE_MAX_SIDE", "4096"))
+DETECT_SIDE = 320
+_detector_lock = threading.Lock()
+_detector_graph = None
+# cheap blur/exposure/size checks that turn hopeless images away before any model work
+QUALITY = QualityConfig.from_env()
+# ingest budget, checked against the header before anything is decoded. images declaring more
+# than MAX_PIXELS are refused outright (decompression bombs); below that, the decoded array
+# must fit in DECODE_BUDGET bytes, which jpeg meets by decoding at 1/2, 1/4 or 1/8 scale
+# and anything else is refused. images whose size can't be read from the header aren't
+# decoded at all; opencv's own pixel limit is set to MAX_PIXELS as a backstop
+MAX_PIXELS = int(os.environ.get("EROS_MAX_PIXELS", "50000000"))
+DECODE_BUDGET = int(os.environ.get("EROS_DECODE_BUDGET_MB", "64")) << 20
+os.environ.setdefault("OPENCV_IO_MAX_IMAGE_PIXELS", str(MAX_PIXELS))
+# record each analysis' peak python/numpy allocation in eros_peak_alloc_bytes. tracemalloc is
+# process-wide, so the numbers are exact in pool workers and approximate with threads
+TRACE_MEMORY = os.environ.get("EROS_TRACE_MEMORY", "0") == "1"
+
+def image_size(data: bytes):
+    # (w, h) straight from the header of a png, jpeg, gif, bmp, webp or tiff, None for
+    # anything else (or a header that doesn't parse)
+    try:
+        if data[:8] == b"\x89PNG\r\n\x1a\n": return struct.unpack(">II", data[16:24])
+        if data[:2] == b"\xff\xd8": return _jpeg_size(data)
+        if data[:4] == b"GIF8": return struct.unpack("<HH", data[6:10])
+        if data[:2] == b"BM":
+            if struct.unpack("<I", data[14:18])[0] == 12: return struct.unpack("<HH", data[18:22])
+            w, h = struct.unpack("<ii", data[18:26])
+            return abs(w), abs(h)  # negative height = top-down rows
+        if data[:4] == b"RIFF" and data[8:12] == b"WEBP": return _webp_size(data)
+        if data[:4] in (b"II*\x00", b"MM\x00*"): return _tiff_size(data)
+    except struct.error:
+        pass
+    return None
+
+def _jpeg_size(data):
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF: return None
+        marker = data[i+1]
+        if marker == 0xFF: i += 1; continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8: i += 2; continue
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            h, w = struct.unpack(">HH", data[i+5:i+9])
+            return w, h
+        i += 2 + struct.unpack(">H", data[i+2:i+4])[0]
+    return None
+
+def _webp_size(data):
+    chunk = data[12:16]
+    if chunk == b"VP8 ":
+        w, h = struct.unpack("<HH", data[26:30])
+        return w & 0x3FFF, h & 0x3FFF
+    if chunk == b"VP8L":
+        bits = struct.unpack("<I", data[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        return 1 + int.from_bytes(data[24:27], "little"), 1 + int.from_bytes(data[27:30], "little")
+    return None
+
+def _tiff_size(data):
+    # ImageWidth (256) and ImageLength (257) from the first IFD
+    e = "<" if data[:2] == b"II" else ">"
+    ifd = struct.unpack(e + "I", data[4:8])[0]
+    n = struct.unpack(e + "H", data[ifd:ifd+2])[0]
+    size = {}
+    for k in range(n):
+        tag, kind = struct.unpack(e + "HH", data[ifd+2+12*k:ifd+6+12*k])
+        if tag in (256, 257):
+            v = data[ifd+10+12*k:ifd+14+12*k]
+            size[tag] = struct.unpack(e + "H", v[:2])[0] if kind == 3 else struct.unpack(e + "I", v)[0]
+    return (size[256], size[257]) if len(size) == 2 else None
+
+def load_image(data: bytes, max_side=None):
+    # decode with the long side capped at max_side; returns (img, original w, original h).
+    # raises ImageTooLarge when the header is over the pixel or decode budget, UnreadableImage
+    # when there's no header we can read the size from
+    import cv2
+    # imdecode asserts on an empty buffer rather than returning None
+    if not data: raise UnreadableImage("Can't read image.")
+    max_side = MAX_SIDE if max_side is None else max_side
+    size = image_size(data)
+    if size is None: raise UnreadableImage("Can't read image.")
+    jpeg = data[:2] == b"\xff\xd8"
+    pixels = size[0] * size[1]
+    if pixels > MAX_PIXELS: raise ImageTooLarge(f"Image too large ({pixels / 1e6:.0f} megapixels).")
+    # jpeg can drop resolution in the DCT domain, skipping most of the decode: as far as
+    # max_side allows, and further if that's what it takes to fit the budget
+    scale = 1
+    for f in (8, 4, 2):
+        if jpeg and max_side and max(size) / f >= max_side: scale = f; break
+    while pixels * 3 / scale**2 > DECODE_BUDGET:
+        if not jpeg or scale == 8: raise ImageTooLarge("Image too large to decode.")
+        scale *= 2
+    flag = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+            4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}[scale]
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), flag)
+    if img is None: return None, 0, 0
+    h, w = img.shape[:2]
+    W, H = size
+    if (W > H) != (w > h): W, H = H, W  # decoder applied an exif rotation
+    if max_side and max(w, h) > max_side:
+        s = max_side / max(w, h)
+        img = cv2.resize(img, (max(1, round(w*s)), max(1, round(h*s))), interpolation=cv2.INTER_AREA)
+    return img, W, H
+
+def config(**overrides):
+    # settings that change the result for a given image; part of the result cache key
+    cascade = CASCADE and {"max_side": CASCADE_MAX_SIDE, "detect_side": DETECT_SIDE}
+    return {"max_side": MAX_SIDE, "cascade": cascade,
+            "quality": QUALITY.to_dict(), "max_pixels": MAX_PIXELS, "decode_budget": DECODE_BUDGET,
+            "schema": 2, **overrides}
+
+class AnalysisError(Exception): pass
+class UnreadableImage(AnalysisError): pass
+class NoFaceDetected(AnalysisError): pass
+class LowQuality(AnalysisError): pass
+class ImageTooLarge(AnalysisError): pass
+
+@dataclass(slots=True)
+class FaceScore:
+    total: float
+    thirds_dev: float
+    thirds_score: float
+    ratio: float
+    face_score: float
+    sym: float
+    sym_score: float
+    nose_ratio: float
+    nose_score: float
+    lip_ratio: float
+    lip_score: float
+    bbox: list | None = None  # [x0, y0, x1, y1] of the landmarks, original pixels
+
+    def to_dict(self): return asdict(self)
+
+def format_report(s: FaceScore) -> str:
     return (
         f"⚡ Raw Brutal Report ⚡\n"
-        f"Overall harsh score: {total:.1f}/100\n"
-        f"Vertical thirds deviation: {thirds_dev:.2f} -> {thirds_score:.1f}/20\n"
-        f"Face ratio L/W: {ratio:.2f} -> {face_score:.1f}/5\n"
-        f"Symmetry factor: {sym:.2f} -> {sym_score:.1f}/25\n"
-        f"Nose width ratio: {nose_w/w_face:.2f} -> {nose_score:.1f}/5\n"
-        f"Lip balance ratio: {(upper_lip/(lower_lip+1e-6)):.2f} -> {lip_score:.1f}/5\n"
+        f"Overall harsh score: {s.total:.1f}/100\n"
+        f"Vertical thirds deviation: {s.thirds_dev:.2f} -> {s.thirds_score:.1f}/20\n"
+        f"Face ratio L/W: {s.ratio:.2f} -> {s.face_score:.1f}/5\n"
+        f"Symmetry factor: {s.sym:.2f} -> {s.sym_score:.1f}/25\n"
+        f"Nose width ratio: {s.nose_ratio:.2f} -> {s.nose_score:.1f}/5\n"
+        f"Lip balance ratio: {s.lip_ratio:.2f} -> {s.lip_score:.1f}/5\n"
         "These numbers are raw geometry only. They don't account for aesthetics, expression, hairstyle, makeup, lighting, angle, etc. Use with caution! "
     )
+
+_buffers = threading.local()
+
+def _rgb(img):
+    # BGR -> RGB into a per-thread scratch buffer that only grows, instead of a fresh
+    # full-size copy per call. the result is only valid until this thread's next call
+    import cv2
+    h, w = img.shape[:2]
+    buf = getattr(_buffers, "rgb", None)
+    if buf is None or buf.size < h * w * 3:
+        buf = _buffers.rgb = np.empty(h * w * 3, np.uint8)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=buf[:h * w * 3].reshape(h, w, 3))
+
+@contextmanager
+def _peak_memory():
+    if not TRACE_MEMORY:
+        yield
+        return
+    if not tracemalloc.is_tracing(): tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    try: yield
+    finally: observe("eros_peak_alloc_bytes", max(0, tracemalloc.get_traced_memory()[1] - base))
+
+def warm_up():
+    # build the default graph and push one blank frame through it, so the first real image
+    # pays for neither
+    mesh, lock = _mesh(1)
+    with lock: mesh.process(np.zeros((192, 192, 3), np.uint8))
+    if CASCADE:
+        det = _detector()
+        with _detector_lock: det.process(np.zeros((DETECT_SIDE, DETECT_SIDE, 3), np.uint8))
+
+def _detector():
+    global _detector_graph
+    with _detector_lock:
+        if _detector_graph is None:
+            import mediapipe as mp
+            # full-range model: faces that are small in the frame are the point of the cascade
+            _detector_graph = mp.solutions.face_detection.FaceDetection(model_selection=1, min_detection_confidence=0.5)
+        return _detector_graph
+
+def _face_boxes(img, max_faces):
+    # cheap stage: face boxes (x0, y0, x1, y1) in img pixels, found on a DETECT_SIDE copy
+    import cv2
+    h, w = img.shape[:2]
+    s = min(1.0, DETECT_SIDE / max(h, w))
+    small = cv2.resize(img, (max(1, round(w*s)), max(1, round(h*s))), interpolation=cv2.INTER_AREA) if s < 1 else img
+    det = _detector()
+    with _detector_lock:
+        res = det.process(_rgb(small))
+    boxes = []
+    for d in (res.detections or [])[:max_faces]:
+        b = d.location_data.relative_bounding_box
+        boxes.append((b.xmin * w, b.ymin * h, (b.xmin + b.width) * w, (b.ymin + b.height) * h))
+    return boxes
+
+def _detect_cascade(img, w, h, max_faces):
+    # FaceMesh on a padded crop around each detected face, landmarks mapped back to original pixels
+    import cv2
+    with timed("detect"):
+        boxes = _face_boxes(img, max_faces)
+    if not boxes: raise NoFaceDetected("No face detected.")
+    ih, iw = img.shape[:2]
+    sx, sy = w / iw, h / ih
+    mesh, lock = _mesh(1)
+    faces = []
+    for x0, y0, x1, y1 in boxes:
+        # the detector box stops at the brows; FaceMesh wants forehead and some margin too
+        pad = 0.5 * max(x1 - x0, y1 - y0)
+        cx0, cy0 = max(0, int(x0 - pad)), max(0, int(y0 - pad))
+        cx1, cy1 = min(iw, int(x1 + pad)), min(ih, int(y1 + pad))
+        if cx1 <= cx0 or cy1 <= cy0: continue
+        crop = img[cy0:cy1, cx0:cx1]
+        cw, ch = cx1 - cx0, cy1 - cy0
+        if MAX_SIDE and max(cw, ch) > MAX_SIDE:
+            s = MAX_SIDE / max(cw, ch)
+            crop = cv2.resize(crop, (max(1, round(cw*s)), max(1, round(ch*s))), interpolation=cv2.INTER_AREA)
+        with timed("color"):
+            rgb = _rgb(crop)
+        with lock, timed("inference"):
+            res = mesh.process(rgb)
+        if not res.multi_face_landmarks: continue
+        with timed("landmarks"):
+            pts = landmarks_array(res.multi_face_landmarks[0], cw, ch)
+            pts += np.array((cx0, cy0, 0), np.float32)
+            pts *= np.array((sx, sy, sx), np.float32)
+        faces.append(pts)
+    if not faces: raise NoFaceDetected("No face detected.")
+    return np.stack(faces)
+
+def _detect(data: bytes, max_side=None, max_faces=1, cascade=None):
+    # decode + inference: (N, 478, 3) landmarks in original pixels, left to right, and the
+    # original w, h. this is the part that runs in the pool
+    with _peak_memory(): return _decode_and_infer(data, max_side, max_faces, cascade)
+
+def _decode_and_infer(data, max_side, max_faces, cascade):
+    cascade = CASCADE if cascade is None else cascade
+    # landmarks come back normalized, so scaling by the original size undoes any shrink
+    with timed("decode"):
+        img, w, h = load_image(data, CASCADE_MAX_SIDE if cascade else max_side)
+    if img is None: raise UnreadableImage("Can't read image.")
+    observe("eros_image_pixels", w * h)
+    if QUALITY.mode != "off":
+        with timed("quality"):
+            issues = quality_check(img, w, h, QUALITY)
+        action = "rejected" if QUALITY.mode == "reject" else "flagged"
+        for issue in issues: count("eros_quality_issues_total", issue=issue.rstrip("."), action=action)
+        if issues and action == "rejected": raise LowQuality(" ".join(issues))
+    if cascade:
+        pts = _detect_cascade(img, w, h, max(1, min(max_faces, MAX_FACES)))
+        return pts[np.argsort(pts[:, :, 0].min(1))], w, h
+    mesh, lock = _mesh(max(1, min(max_faces, MAX_FACES)))
+    with timed("color"):
+        rgb = _rgb(img)
+    with lock, timed("inference"):
+        res = mesh.process(rgb)
+    if not res.multi_face_landmarks: raise NoFaceDetected("No face detected.")
+
+    with timed("landmarks"):
+        pts = np.stack([landmarks_array(f, w, h) for f in res.multi_face_landmarks])
+        pts = pts[np.argsort(pts[:, :, 0].min(1))]
+    return pts, w, h
+
+def score_landmarks(pts, w, h, own_midline=False) -> list[FaceScore]:
+    # every face scored in one vectorized pass; own_midline as in geometry.score_faces
+    with timed("geometry"):
+        m = score_faces(pts, w, own_midline)
+        lo = np.clip(pts[:, :, :2].min(1), 0, (w, h)).astype(int)
+        hi = np.clip(pts[:, :, :2].max(1), 0, (w, h)).astype(int)
+        return [
+            FaceScore(**{k: float(v[i]) for k, v in m.items()}, bbox=[*lo[i].tolist(), *hi[i].tolist()])
+            for i in range(len(pts))
+        ]
+
+_pool = None
+_store = None
+
+def start_pool(workers=None):
+    # run inference in a pool of worker processes, one FaceMesh each (default: one per core)
+    global _pool
+    from mesh_pool import MeshPool
+    if _pool is None: _pool = MeshPool(workers)
+    return _pool
+
+def use_landmark_store(store):
+    # keep the landmarks of every analyzed image in a LandmarkStore (None to stop)
+    global _store
+    _store = store
+
+def detect(data: bytes, max_faces=1, max_side=None, cascade=None):
+    # _detect in the pool if there is one, counting outcomes and filing the landmarks
+    observe("eros_image_bytes", len(data))
+    args = (data, max_side, max_faces, cascade)
+    try: pts, w, h = _pool.run(_detect, *args) if _pool is not None else _detect(*args)
+    except UnreadableImage:
+        count("eros_results_total", outcome="unreadable")
+        raise
+    except NoFaceDetected:
+        count("eros_results_total", outcome="no_face")
+        raise
+    except LowQuality:
+        count("eros_results_total", outcome="low_quality")
+        raise
+    except ImageTooLarge:
+        count("eros_results_total", outcome="too_large")
+        raise
+    count("eros_results_total", outcome="ok")
+    if _store is not None: _store.add(content_hash(data), pts, w, h)
+    return pts, w, h
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def analyze(data: bytes, max_side=None) -> FaceScore:
+    # in-memory entry point: encoded image bytes straight from the request, no disk round trip.
+    # raises AnalysisError when there's nothing to score
+    return score_landmarks(*detect(data, 1, max_side))[0]
+
+def analyze_faces(data: bytes, max_faces=MAX_FACES, max_side=None) -> list[FaceScore]:
+    # every face in the image (up to max_faces) from a single inference, left to right
+    return score_landmarks(*detect(data, max_faces, max_side), own_midline=True)
+
+def analyze_bytes(data: bytes, max_side=None) -> str:
+    try: score = analyze(data, max_side)
+    except AnalysisError as e: return f"❌ {e}"
+    with timed("report"): return format_report(score)
+
+def brutal_report(img_path: Path, max_side=None) -> str:
+    try: data = Path(img_path).read_bytes()
+    except OSError: return "❌ Can't read image."
+    return analyze_bytes(data, max_side)
@@ -0,0 +1,129 @@
+import json
+from dataclasses import dataclass, field, replace
+
+import numpy as np
+
+L = {"top":10,"brow":9,"nose":2,"chin":152,"left":234,"right":454,
+     "eyeL":133,"eyeR":362,"noseL":98,"noseR":327,
+     "lipU":13,"lipM":14,"lipL":17}
+
+def ratio_score(actual, ideal, full=0.05, zero=0.2):
+    # harsher scoring: tiny deviations drop points fast. 10 within `full` relative
+    # deviation, falling linearly to 0 at `zero`
+    dev = np.abs(actual - ideal) / ideal
+    return np.where(dev <= full, 10.0, np.where(dev <= zero, 10 * (zero - dev) / (zero - full), 0.0))
+
+def landmarks_array(face_landmarks, w, h):
+    # mediapipe landmark proto -> (478, 3) float32 in pixels (z uses the x scale, like mediapipe)
+    lm = face_landmarks.landmark
+    pts = np.fromiter((v for p in lm for v in (p.x, p.y, p.z)), np.float32, 3 * len(lm)).reshape(-1, 3)
+    pts *= np.array((w, h, w), np.float32)
+    return pts
+
+
+# scoring profiles: each rule measures something, turns it into points, and the
+# points add up (clipped) to the total. kinds:
+#   spread  pairs are segments that should be equal; value = mean relative deviation,
+#           points = weight * max(0, 1 - slope * value)
+#   ratio   pairs = (numerator, denominator); value = |num| / (|den| + eps),
+#           points = weight * ratio_score(value, ideal, *tol)
+#   center  pairs = ((a, b),); value = 1 - |a.x + b.x - image width| / image width,
+#           points = weight * value. with pairs = ((a, b), (c, d)) the midline and width
+#           come from c..d instead of the image: 1 - |a.x + b.x - c.x - d.x| / |d.x - c.x|
+@dataclass(frozen=True, slots=True)
+class Rule:
+    name: str    # key for the points
+    value: str   # key for the measured value
+    kind: str
+    pairs: tuple
+    weight: float
+    ideal: float = 1.0
+    tol: tuple = (0.05, 0.2)
+    slope: float = 1.0
+    eps: float = 0.0
+
+@dataclass(frozen=True, slots=True)
+class Profile:
+    name: str
+    rules: tuple
+    clip: tuple = (0.0, 100.0)
+    _pairs: tuple = field(default=(), init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # every landmark pair the rules need, so all distances come from one gather
+        pairs = []
+        for r in self.rules:
+            for a, b in r.pairs:
+                p = (_index(a), _index(b))
+                if p not in pairs: pairs.append(p)
+        object.__setattr__(self, "_pairs", tuple(pairs))
+
+    @classmethod
+    def from_dict(cls, d):
+        rules = tuple(Rule(**{**r, "pairs": tuple(map(tuple, r["pairs"])), "tol": tuple(r.get("tol", (0.05, 0.2)))})
+                      for r in d["rules"])
+        return cls(d["name"], rules, tuple(d.get("clip", (0.0, 100.0))))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f: return cls.from_dict(json.load(f))
+
+def _index(p): return L[p] if isinstance(p, str) else int(p)
+
+# the brutal scoring (face/nose/lip points really are out of 50, not the 5 the report says)
+DEFAULT_PROFILE = Profile("brutal", (
+    Rule("thirds_score", "thirds_dev", "spread", (("top", "brow"), ("brow", "nose"), ("nose", "chin")), 20, slope=2),
+    Rule("face_score", "ratio", "ratio", (("top", "chin"), ("left", "right")), 5, ideal=1.618),
+    Rule("sym_score", "sym", "center", (("eyeL", "eyeR"),), 25),
+    Rule("nose_score", "nose_ratio", "ratio", (("noseL", "noseR"), ("left", "right")), 5, ideal=0.28),
+    Rule("lip_score", "lip_ratio", "ratio", (("lipU", "lipM"), ("lipM", "lipL")), 5, ideal=1/1.6, eps=1e-6),
+))
+# the same, with symmetry taken about each face's own midline (cheek to cheek) rather than the
+# image centre, so a face in a group photo scores the same wherever it stands
+FACE_PROFILE = Profile("brutal-face", tuple(
+    replace(r, pairs=r.pairs + (("left", "right"),)) if r.kind == "center" else r
+    for r in DEFAULT_PROFILE.rules
+))
+
+def apply_profile(profile, pts, w):
+    # pts: (478, 3) or (N, 478, 3) pixel landmarks, w: image width(s). returns a dict of
+    # per-face arrays (scalars for a single face): "total" plus every rule's value and points
+    pts = np.asarray(pts, np.float32)
+    w = np.asarray(w, np.float64)
+    pairs = np.array(profile._pairs)
+    d = np.linalg.norm(pts[..., pairs[:, 0], :2] - pts[..., pairs[:, 1], :2], axis=-1).astype(np.float64)
+    col = {p: i for i, p in enumerate(profile._pairs)}
+    dist = lambda a, b: d[..., col[(_index(a), _index(b))]]
+
+    out = {"total": 0.0}
+    total = 0.0
+    for r in profile.rules:
+        if r.kind == "spread":
+            seg = np.stack([dist(a, b) for a, b in r.pairs], -1)
+            mean = seg.mean(-1, keepdims=True)
+            value = (np.abs(seg - mean) / mean).mean(-1)
+            points = np.maximum(0, r.weight * (1 - value*r.slope))
+        elif r.kind == "ratio":
+            value = dist(*r.pairs[0]) / (dist(*r.pairs[1]) + r.eps)
+            points = ratio_score(value, r.ideal, *r.tol) * r.weight
+        elif r.kind == "center":
+            (a, b), *ref = r.pairs
+            x = pts[..., _index(a), 0].astype(np.float64) + pts[..., _index(b), 0]
+            if ref:
+                (c, e), = ref
+                lo, hi = pts[..., _index(c), 0].astype(np.float64), pts[..., _index(e), 0].astype(np.float64)
+                value = 1 - np.abs(x - lo - hi) / np.maximum(np.abs(hi - lo), 1e-6)
+            else:
+                value = 1 - np.abs(x - w) / w
+            points = value * r.weight
+        else:
+            raise ValueError(f"unknown rule kind {r.kind!r}")
+        out[r.value], out[r.name] = value, points
+        total = total + points
+    out["total"] = np.clip(total, *profile.clip)
+    return out
+
+def score_faces(pts, w, own_midline=False):
+    # the standard score; same shapes as apply_profile. own_midline: symmetry about each
+    # face's midline instead of the image centre (multi-face mode)
+    return apply_profile(FACE_PROFILE if own_midline else DEFAULT_PROFILE, pts, w)
@@ -0,0 +1,15 @@
+# gunicorn settings, picked up automatically from the repo root: gunicorn app:app
+import os
+
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+threads = int(os.environ.get("EROS_THREADS", "8"))
+
+# every gunicorn worker gets its own inference pool, so the host's cores are split between
+# them instead of each one starting a pool the size of the machine
+os.environ.setdefault("EROS_WORKERS", str(max(1, (os.cpu_count() or 1) // workers)))
+
+def post_worker_init(worker):
+    # runs after the app is loaded and before the worker accepts connections, so the
+    # pool is up and warm before the first request
+    import app
+    app.startup()
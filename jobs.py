@@ -0,0 +1,77 @@
+import queue
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+
+
+class QueueFull(Exception): pass
+
+@dataclass(slots=True, eq=False)
+class Job:
+    id: str
+    args: tuple
+    status: str = "queued"  # queued -> running -> done
+    result: object = None
+    finished: float = 0.0
+    done: threading.Event = field(default_factory=threading.Event)
+
+    def to_dict(self):
+        d = {"id": self.id, "status": self.status}
+        if self.status == "done": d["result"] = self.result
+        return d
+
+
+class JobQueue:
+    # bounded in-process queue drained by background threads. submit() never blocks:
+    # when max_pending jobs are already waiting it raises QueueFull so the caller can shed load.
+    # finished jobs are kept for `keep` seconds for clients to collect
+    def __init__(self, fn, workers=4, max_pending=64, keep=600):
+        self.fn = fn
+        self.keep = keep
+        self._q = queue.Queue(maxsize=max_pending)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._busy_time = 0.0
+        self._served = 0
+        self.workers = workers
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True).start()
+
+    def submit(self, *args) -> Job:
+        job = Job(uuid.uuid4().hex, args)
+        try: self._q.put_nowait(job)
+        except queue.Full: raise QueueFull from None
+        with self._lock:
+            self._expire()
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        with self._lock: return self._jobs.get(job_id)
+
+    def retry_after(self) -> int:
+        # rough seconds until a slot frees up, from the average time a job has taken so far
+        avg = self._busy_time / self._served if self._served else 1.0
+        return max(1, round(avg * self._q.qsize() / self.workers))
+
+    def stats(self):
+        return {"pending": self._q.qsize(), "capacity": self._q.maxsize, "served": self._served}
+
+    def _expire(self):
+        cutoff = time.time() - self.keep
+        for jid in [j.id for j in self._jobs.values() if j.finished and j.finished < cutoff]:
+            del self._jobs[jid]
+
+    def _work(self):
+        while True:
+            job = self._q.get()
+            job.status = "running"
+            start = time.perf_counter()
+            try: job.result = self.fn(*job.args)
+            except Exception as e: job.result = {"error": f"{type(e).__name__}: {e}"}
+            self._busy_time += time.perf_counter() - start
+            self._served += 1
+            job.status = "done"
+            job.finished = time.time()
+            job.done.set()
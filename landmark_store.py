@@ -0,0 +1,92 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+try: import fcntl
+except ImportError: fcntl = None  # no cross-process locking on windows, threads are still safe
+
+N_LANDMARKS = 478
+ROW_BYTES = N_LANDMARKS * 3 * 4
+
+
+class LandmarkStore:
+    # every face's landmarks as float32 (478, 3) rows in one flat file, read through a
+    # memory map, plus a sqlite index of image hash -> rows and original image size.
+    # appends from several processes are serialized with a file lock; readers only
+    # page in the rows they touch
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._data = self.root / "landmarks.f32"
+        self._data.touch(exist_ok=True)
+        self._db = sqlite3.connect(str(self.root / "index.sqlite"), timeout=30,
+                                   check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS faces (hash TEXT, face INTEGER, row INTEGER UNIQUE,"
+            " width INTEGER, height INTEGER, PRIMARY KEY (hash, face))"
+        )
+        self._lock = threading.Lock()
+        self._mm = None
+
+    def __len__(self):
+        # the index is the source of truth: rows past it are from an append still in progress
+        return self._db.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM faces").fetchone()[0]
+
+    def __contains__(self, image_hash):
+        return self._db.execute("SELECT 1 FROM faces WHERE hash = ?", (image_hash,)).fetchone() is not None
+
+    def array(self, n=None) -> np.ndarray:
+        # read-only (N, 478, 3) view of the stored rows, nothing is loaded until touched
+        n = len(self) if n is None else n
+        if n == 0: return np.empty((0, N_LANDMARKS, 3), np.float32)
+        if self._mm is None or len(self._mm) < n:
+            self._mm = np.memmap(self._data, np.float32, "r", shape=(n, N_LANDMARKS, 3))
+        return self._mm[:n]
+
+    def get(self, image_hash):
+        # (pts (F, 478, 3), w, h) for a stored image, None if it's not here
+        rows = self._db.execute(
+            "SELECT row, width, height FROM faces WHERE hash = ? ORDER BY face", (image_hash,)
+        ).fetchall()
+        if not rows: return None
+        pts = np.array(self.array(max(r[0] for r in rows) + 1)[[r[0] for r in rows]])
+        return pts, rows[0][1], rows[0][2]
+
+    def index(self):
+        # (hashes, face numbers, widths, heights) in row order, for scoring the whole store
+        rows = self._db.execute("SELECT hash, face, width, height FROM faces ORDER BY row").fetchall()
+        hashes = [r[0] for r in rows]
+        faces, widths, heights = (np.array([r[i] for r in rows], np.int64) for i in (1, 2, 3))
+        return hashes, faces, widths, heights
+
+    def add(self, image_hash, pts, w, h):
+        # append all faces of an image; a hash that's already stored is left alone
+        pts = np.ascontiguousarray(pts, np.float32).reshape(-1, N_LANDMARKS, 3)
+        with self._lock, self._file_lock():
+            if image_hash in self: return
+            start = len(self)
+            with open(self._data, "r+b") as f:
+                f.seek(start * ROW_BYTES)
+                f.write(pts.tobytes())
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+            self._db.executemany(
+                "INSERT INTO faces VALUES (?, ?, ?, ?, ?)",
+                [(image_hash, i, start + i, int(w), int(h)) for i in range(len(pts))],
+            )
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.root / "lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try: yield
+            finally: fcntl.flock(f, fcntl.LOCK_UN)
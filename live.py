@@ -0,0 +1,132 @@
+# live face scoring from a webcam or a video file
+#   python live.py                 webcam 0
+#   python live.py --source clip.mp4 --no-window
+
+import argparse
+import time
+
+import numpy as np
+
+from geometry import L, landmarks_array, score_faces
+
+
+class LiveAnalyzer:
+    # FaceMesh in tracking mode on a crop around the last face. when inference runs
+    # over the frame budget the next frames reuse the previous landmarks instead
+    def __init__(self, target_fps=30, pad=0.35):
+        import mediapipe as mp
+        self.mesh = mp.solutions.face_mesh.FaceMesh(
+            static_image_mode=False,
+            max_num_faces=1,
+            refine_landmarks=True,
+            min_detection_confidence=0.5,
+            min_tracking_confidence=0.5,
+        )
+        self.budget_ms = 1000 / target_fps
+        self.pad = pad
+        self.roi = None      # (x0, y0, x1, y1) crop in frame pixels, None = whole frame
+        self.pts = None      # (478, 3) last landmarks in frame pixels
+        self.score = None    # last score_faces() result
+        self.infer_ms = 0.0  # smoothed inference latency
+        self.skip = 0
+
+    def step(self, frame) -> bool:
+        # returns True when this frame went through the model
+        import cv2
+        if self.skip:
+            self.skip -= 1
+            return False
+        h, w = frame.shape[:2]
+        x0, y0, x1, y1 = self.roi or (0, 0, w, h)
+        crop = frame[y0:y1, x0:x1]
+
+        start = time.perf_counter()
+        res = self.mesh.process(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
+        ms = (time.perf_counter() - start) * 1000
+        self.infer_ms = ms if not self.infer_ms else 0.9 * self.infer_ms + 0.1 * ms
+
+        if res.multi_face_landmarks:
+            pts = landmarks_array(res.multi_face_landmarks[0], x1 - x0, y1 - y0)
+            pts[:, 0] += x0
+            pts[:, 1] += y0
+            self.pts = pts
+            self.score = score_faces(pts, w)
+            self._update_roi(w, h)
+        else:
+            self.pts = self.score = self.roi = None
+        # over budget: let the frames we can't afford reuse these landmarks
+        self.skip = int(ms // self.budget_ms)
+        return True
+
+    def _update_roi(self, w, h):
+        fx0, fy0 = self.pts[:, :2].min(0)
+        fx1, fy1 = self.pts[:, :2].max(0)
+        if self.roi:
+            # keep the crop still while the face stays well inside it, tracking works best that way
+            x0, y0, x1, y1 = self.roi
+            mx, my = (x1 - x0) * 0.1, (y1 - y0) * 0.1
+            if fx0 > x0 + mx and fy0 > y0 + my and fx1 < x1 - mx and fy1 < y1 - my:
+                return
+        px, py = (fx1 - fx0) * self.pad, (fy1 - fy0) * self.pad
+        self.roi = (max(0, int(fx0 - px)), max(0, int(fy0 - py)),
+                    min(w, int(fx1 + px) + 1), min(h, int(fy1 + py) + 1))
+
+    def draw(self, frame, fps):
+        import cv2
+        if self.pts is not None:
+            for i in L.values():
+                cv2.circle(frame, (int(self.pts[i, 0]), int(self.pts[i, 1])), 3, (0, 255, 0), -1)
+        if self.roi:
+            cv2.rectangle(frame, self.roi[:2], self.roi[2:], (255, 0, 0), 1)
+        lines = [f"FPS {fps:.1f}  infer {self.infer_ms:.1f} ms"]
+        if self.score is not None:
+            lines.append(f"score {float(self.score['total']):.1f}/100")
+        for i, text in enumerate(lines):
+            cv2.putText(frame, text, (10, 25 + 25 * i), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Live face scoring from a camera or a video file.")
+    ap.add_argument("--source", default="0", help="camera index or video file (default: 0)")
+    ap.add_argument("--fps", type=float, default=30, help="frame-time budget to keep up with")
+    ap.add_argument("--no-window", action="store_true", help="don't open a window, just print a summary")
+    args = ap.parse_args(argv)
+    import cv2
+
+    camera = args.source.isdigit()
+    cap = cv2.VideoCapture(int(args.source) if camera else args.source)
+    if not cap.isOpened():
+        raise SystemExit(f"Error: Could not open {args.source}")
+
+    live = LiveAnalyzer(target_fps=args.fps)
+    frames = inferred = 0
+    fps = 0.0
+    scores = []
+    start = last = time.perf_counter()
+    while True:
+        ok, frame = cap.read()
+        if not ok: break
+        if camera: frame = cv2.flip(frame, 1)
+        frames += 1
+        inferred += live.step(frame)
+        if live.score is not None: scores.append(float(live.score["total"]))
+
+        now = time.perf_counter()
+        fps = 0.9 * fps + 0.1 / max(now - last, 1e-6) if fps else 1 / max(now - last, 1e-6)
+        last = now
+        if not args.no_window:
+            live.draw(frame, fps)
+            cv2.imshow("Eros live", frame)
+            if cv2.waitKey(1) & 0xFF == ord("q"): break
+
+    cap.release()
+    cv2.destroyAllWindows()
+    elapsed = time.perf_counter() - start
+    print(f"{frames} frames in {elapsed:.1f}s ({frames / max(elapsed, 1e-6):.1f} fps), "
+          f"{inferred} inferred, avg inference {live.infer_ms:.1f} ms")
+    if scores:
+        print(f"median score {np.median(scores):.1f}/100, best {max(scores):.1f}/100")
+
+
+if __name__ == "__main__":
+    main()
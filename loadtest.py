@@ -0,0 +1,159 @@
+# http load test for the upload route, with a machine-readable summary
+#   python loadtest.py --start --concurrency 8 --duration 30          closed loop
+#   python loadtest.py --start --asgi --rate 20 --duration 30         open loop, 20 req/s
+#   python loadtest.py --url http://host:5000/ -o run.json            against a running server
+# images are replayed round-robin from static/uploads and test_programs/examples. there are only
+# a handful, so a started server runs with the result cache off (--cache to keep it); otherwise
+# everything after the first pass is a cache hit and the numbers measure the LRU, not analysis
+
+import argparse
+import glob
+import http.client
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import numpy as np
+
+from slow_clients import multipart
+
+SOURCES = ["static/uploads/*.jpg", "test_programs/examples/*.jpg"]
+
+
+def load_images():
+    return [open(p, "rb").read() for p in sorted(p for pattern in SOURCES for p in glob.glob(pattern))]
+
+def send(url, data, timeout):
+    # one upload; returns (ok, seconds)
+    u = urlparse(url)
+    body, ctype = multipart(data)
+    start = time.perf_counter()
+    try:
+        conn = http.client.HTTPConnection(u.hostname, u.port or 80, timeout=timeout)
+        conn.request("POST", u.path or "/", body, {"Content-Type": ctype})
+        resp = conn.getresponse()
+        resp.read()
+        conn.close()
+        ok = resp.status == 200
+    except OSError:
+        ok = False
+    return ok, time.perf_counter() - start
+
+def closed_loop(url, images, concurrency, duration, timeout):
+    # every client sends its next upload as soon as the last one comes back
+    results, lock = [], threading.Lock()
+    stop = time.perf_counter() + duration
+    feed = itertools.cycle(images)
+    def client():
+        while time.perf_counter() < stop:
+            with lock: data = next(feed)
+            r = send(url, data, timeout)
+            with lock: results.append(r)
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    return results
+
+def open_loop(url, images, rate, duration, timeout, max_inflight):
+    # poisson arrivals at `rate`, whether or not earlier uploads have finished. latency is
+    # counted from the scheduled send time, so a backed-up server can't hide its queueing
+    results, lock = [], threading.Lock()
+    rng = random.Random(0)
+    def fire(data, due):
+        ok, _ = send(url, data, timeout)
+        with lock: results.append((ok, time.perf_counter() - due))
+    with ThreadPoolExecutor(max_workers=max_inflight) as ex:
+        start = due = time.perf_counter()
+        for data in itertools.cycle(images):
+            due += rng.expovariate(rate)
+            if due - start > duration: break
+            time.sleep(max(0.0, due - time.perf_counter()))
+            ex.submit(fire, data, due)
+    return results
+
+def summarize(results, elapsed):
+    lat = np.array([s for ok, s in results if ok]) * 1000
+    errors = sum(not ok for ok, _ in results)
+    pct = lambda q: float(np.percentile(lat, q)) if len(lat) else None
+    return {
+        "requests": len(results), "errors": errors,
+        "error_rate": errors / len(results) if results else 0.0,
+        "throughput_rps": (len(results) - errors) / elapsed if elapsed else 0.0,
+        "latency_ms": {"p50": pct(50), "p95": pct(95), "p99": pct(99),
+                       "mean": float(lat.mean()) if len(lat) else None},
+    }
+
+def wait_until_up(url, timeout=120):
+    u = urlparse(url)
+    end = time.time() + timeout
+    while time.time() < end:
+        try:
+            conn = http.client.HTTPConnection(u.hostname, u.port or 80, timeout=2)
+            conn.request("GET", "/")
+            if conn.getresponse().status == 200: return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f"server at {url} didn't come up")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Load-test the upload route and report throughput and latency.")
+    ap.add_argument("--url", default="http://127.0.0.1:5000/")
+    ap.add_argument("--start", action="store_true", help="start app.py locally for the run")
+    ap.add_argument("--asgi", action="store_true", help="with --start: use the async serving mode")
+    ap.add_argument("--cache", action="store_true", help="with --start: keep the result cache on")
+    ap.add_argument("--concurrency", type=int, default=4, help="closed loop: clients sending back to back")
+    ap.add_argument("--rate", type=float, help="open loop: arrivals per second (overrides --concurrency)")
+    ap.add_argument("--max-inflight", type=int, default=256, help="open loop: cap on outstanding requests")
+    ap.add_argument("--duration", type=float, default=30)
+    ap.add_argument("--timeout", type=float, default=60, help="per-request timeout, counted as an error")
+    ap.add_argument("-o", "--out", help="also write the json summary here")
+    args = ap.parse_args(argv)
+
+    images = load_images()
+    if not images: raise SystemExit("no sample images found")
+    server = None
+    if args.start:
+        cmd = [sys.executable, "app.py"] + (["--asgi"] if args.asgi else [])
+        env = {**os.environ, "EROS_SAVE_UPLOADS": os.environ.get("EROS_SAVE_UPLOADS", "0")}
+        if not args.cache:
+            env["EROS_CACHE_SIZE"] = "0"
+            env.pop("EROS_CACHE_DB", None)
+        server = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+    try:
+        wait_until_up(args.url)
+        start = time.perf_counter()
+        if args.rate:
+            results = open_loop(args.url, images, args.rate, args.duration, args.timeout, args.max_inflight)
+        else:
+            results = closed_loop(args.url, images, args.concurrency, args.duration, args.timeout)
+        elapsed = time.perf_counter() - start
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    summary = {
+        "config": {"url": args.url, "mode": "open" if args.rate else "closed",
+                   "rate": args.rate, "concurrency": None if args.rate else args.concurrency,
+                   "duration": args.duration, "asgi": args.asgi, "images": len(images),
+                   "workers": os.environ.get("EROS_WORKERS"),
+                   # an external server's cache is whatever it was started with
+                   "cache": ("on" if args.cache else "off") if args.start else "unknown"},
+        **summarize(results, elapsed),
+    }
+    print(json.dumps(summary, indent=2))
+    if args.out:
+        with open(args.out, "w") as f: json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
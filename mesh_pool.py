@@ -0,0 +1,53 @@
+import atexit
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import metrics
+
+
+def _init_worker():
+    # every worker builds its own FaceMesh graph on import and warms it before taking jobs
+    import face_analyzer
+    face_analyzer.warm_up()
+
+def _traced(fn, *args):
+    # run a job and send back the stage timings it recorded along with the outcome
+    with metrics.capture() as events:
+        try: return fn(*args), None, events
+        except Exception as e: return None, e, events
+
+def _ready():
+    time.sleep(0.05)  # hold the worker so the other pings land on the other workers
+    return os.getpid()
+
+
+class MeshPool:
+    # N worker processes, each with a private pre-warmed FaceMesh.
+    # jobs go through the executor's single FIFO call queue, so when every
+    # worker is busy requests are served in the order they arrived.
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        # spawn, not fork: mediapipe graphs own threads that don't survive a fork
+        self._ex = ProcessPoolExecutor(
+            self.workers, mp_context=get_context("spawn"), initializer=_init_worker
+        )
+        # block until every worker has finished its warm-up
+        seen = set()
+        while len(seen) < self.workers:
+            seen.update(f.result() for f in [self._ex.submit(_ready) for _ in range(self.workers)])
+        atexit.register(self.close)
+
+    def submit(self, fn, *args):
+        return self._ex.submit(fn, *args)
+
+    def run(self, fn, *args):
+        # like submit(fn, *args).result(), but the worker's measurements land in this process
+        result, err, events = self.submit(_traced, fn, *args).result()
+        metrics.replay(events)
+        if err is not None: raise err
+        return result
+
+    def close(self):
+        self._ex.shutdown(wait=False, cancel_futures=True)
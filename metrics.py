@@ -0,0 +1,124 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+SECONDS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+# name -> (help, buckets) for histograms, name -> help for counters
+HISTOGRAMS = {
+    "eros_stage_seconds": ("Time spent in each analysis stage.", SECONDS),
+    "eros_request_seconds": ("HTTP request latency by endpoint.", SECONDS),
+    "eros_image_bytes": ("Size of analyzed uploads in bytes.", (16e3, 64e3, 256e3, 1e6, 4e6, 16e6, 64e6)),
+    "eros_image_pixels": ("Pixel count of analyzed images.", (1e5, 3e5, 1e6, 3e6, 12e6, 50e6)),
+    "eros_peak_alloc_bytes": ("Peak allocation per analysis (EROS_TRACE_MEMORY=1).", (1e6, 4e6, 16e6, 64e6, 256e6, 1e9)),
+}
+COUNTERS = {
+    "eros_results_total": "Analyses by outcome (ok, no_face, unreadable, low_quality, too_large).",
+    "eros_quality_issues_total": "Quality gate findings by issue and action (rejected or flagged).",
+}
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_hists = {}     # (name, labels) -> [per-bucket counts..., +Inf count, sum]
+_gauges = {}    # name -> (help, type, fn); fn returns a number or {labels: number}
+_local = threading.local()
+
+
+def _labels(kw): return tuple(sorted(kw.items()))
+
+def _record(kind, name, value, labels):
+    for events in getattr(_local, "stack", ()):
+        events.append((kind, name, value, labels))
+    with _lock:
+        if kind == "count":
+            _counters[(name, labels)] = _counters.get((name, labels), 0) + value
+            return
+        buckets = HISTOGRAMS[name][1]
+        h = _hists.setdefault((name, labels), [0] * (len(buckets) + 2))
+        h[bisect_left(buckets, value)] += 1
+        h[-1] += value
+
+def count(name, amount=1, **labels): _record("count", name, amount, _labels(labels))
+def observe(name, value, **labels): _record("observe", name, value, _labels(labels))
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try: yield
+    finally: observe("eros_stage_seconds", time.perf_counter() - start, stage=stage)
+
+def gauge(name, help, fn, type="gauge"):
+    # value read at scrape time, e.g. cache or queue stats owned by another object
+    _gauges[name] = (help, type, fn)
+
+
+def start_capture():
+    # from now on every count/observe made on this thread is also appended to the returned
+    # list, until stop_capture(). used for the Server-Timing header and to ship a pool
+    # worker's measurements back to the parent
+    events = []
+    _local.__dict__.setdefault("stack", []).append(events)
+    return events
+
+def stop_capture(events):
+    stack = getattr(_local, "stack", [])
+    if any(e is events for e in stack):
+        stack[:] = [e for e in stack if e is not events]
+
+@contextmanager
+def capture():
+    events = start_capture()
+    try: yield events
+    finally: stop_capture(events)
+
+def replay(events):
+    for kind, name, value, labels in events:
+        _record(kind, name, value, labels)
+
+def stage_totals(events):
+    totals = {}
+    for kind, name, value, labels in events:
+        if name == "eros_stage_seconds":
+            stage = dict(labels)["stage"]
+            totals[stage] = totals.get(stage, 0.0) + value
+    return totals
+
+def server_timing(events):
+    # Server-Timing header value for captured events, one entry per stage
+    return ", ".join(f"{stage};dur={sec * 1000:.1f}" for stage, sec in stage_totals(events).items())
+
+
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items: return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+def render() -> str:
+    # prometheus text exposition format
+    out = []
+    with _lock:
+        counters, hists = dict(_counters), {k: list(v) for k, v in _hists.items()}
+    for name, help in COUNTERS.items():
+        out += [f"# HELP {name} {help}", f"# TYPE {name} counter"]
+        out += [f"{name}{_fmt_labels(l)} {v}" for (n, l), v in sorted(counters.items()) if n == name]
+    for name, (help, buckets) in HISTOGRAMS.items():
+        out += [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+        for (n, l), h in sorted(hists.items()):
+            if n != name: continue
+            total = 0
+            for bound, c in zip(buckets, h):
+                total += c
+                out.append(f"{name}_bucket{_fmt_labels(l, [('le', bound)])} {total}")
+            total += h[len(buckets)]
+            out.append(f"{name}_bucket{_fmt_labels(l, [('le', '+Inf')])} {total}")
+            out.append(f"{name}_sum{_fmt_labels(l)} {h[-1]}")
+            out.append(f"{name}_count{_fmt_labels(l)} {total}")
+    for name, (help, type, fn) in _gauges.items():
+        out += [f"# HELP {name} {help}", f"# TYPE {name} {type}"]
+        value = fn()
+        if isinstance(value, dict):
+            out += [f"{name}{_fmt_labels(_labels(l))} {v}" for l, v in value.items()]
+        else:
+            out.append(f"{name} {value}")
+    return "\n".join(out) + "\n"
@@ -0,0 +1,120 @@
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try: import fcntl
+except ImportError: fcntl = None  # no cross-process locking on windows, threads are still safe
+
+# value range per FaceScore metric; anything outside lands in the edge bins
+RANGES = {
+    "total": (0, 100), "thirds_dev": (0, 1), "thirds_score": (0, 20),
+    "ratio": (0, 3), "face_score": (0, 50), "sym": (-1, 1), "sym_score": (-25, 25),
+    "nose_ratio": (0, 1), "nose_score": (0, 50), "lip_ratio": (0, 5), "lip_score": (0, 50),
+}
+
+
+class Sketch:
+    # fixed-bin histogram over a known range: updates are one increment, two sketches
+    # merge by adding counts, and rank lookups read a cached cumulative table
+    def __init__(self, lo, hi, bins=2000, counts=None):
+        self.lo, self.hi, self.bins = float(lo), float(hi), bins
+        self.counts = np.zeros(bins, np.int64) if counts is None else counts
+        self._cum = None
+
+    def _bin(self, value):
+        i = int((value - self.lo) / (self.hi - self.lo) * self.bins)
+        return min(max(i, 0), self.bins - 1)
+
+    def add(self, value):
+        self.counts[self._bin(value)] += 1
+        self._cum = None
+
+    def merge(self, other):
+        self.counts += other.counts
+        self._cum = None
+
+    @property
+    def n(self): return int(self.counts.sum())
+
+    def percentile(self, value):
+        # % of the population scoring below value (half of its own bin counts as below)
+        if self._cum is None: self._cum = np.concatenate(([0], np.cumsum(self.counts)))
+        total = self._cum[-1]
+        if not total: return None
+        i = self._bin(value)
+        return 100.0 * (self._cum[i] + self.counts[i] / 2) / total
+
+
+class Population:
+    # one sketch per metric, fed with every new result; snapshots go to a .npz file shared by
+    # every process. each process only adds what it counted since its last snapshot to what's
+    # on disk, under a file lock, and picks up everyone else's counts in return
+    def __init__(self, path=None, bins=2000):
+        self.path = path
+        self._lock = threading.Lock()
+        self.sketches = {k: Sketch(lo, hi, bins) for k, (lo, hi) in RANGES.items()}
+        self._unsaved = {k: np.zeros(bins, np.int64) for k in RANGES}
+        if path and os.path.exists(path): self.restore(path)
+
+    def add(self, result: dict):
+        with self._lock:
+            for k, s in self.sketches.items():
+                if result.get(k) is not None:
+                    s.add(result[k])
+                    self._unsaved[k][s._bin(result[k])] += 1
+
+    def percentile(self, metric, value):
+        with self._lock: return self.sketches[metric].percentile(value)
+
+    def ranks(self, result: dict):
+        return {k: self.percentile(k, result[k]) for k in self.sketches if result.get(k) is not None}
+
+    def merge(self, other):
+        with self._lock:
+            for k, s in self.sketches.items():
+                s.merge(other.sketches[k])
+                self._unsaved[k] += other.sketches[k].counts
+
+    def snapshot(self):
+        with self._lock:
+            delta = self._unsaved
+            self._unsaved = {k: np.zeros_like(v) for k, v in delta.items()}
+        try:
+            with self._file_lock():
+                merged = {k: v.copy() for k, v in delta.items()}
+                if os.path.exists(self.path):
+                    with np.load(self.path) as f:
+                        for k in merged:
+                            if k in f and len(f[k]) == len(merged[k]): merged[k] += f[k].astype(np.int64)
+                tmp = f"{self.path}.tmp.npz"
+                np.savez(tmp, **merged)
+                os.replace(tmp, self.path)
+        except BaseException:
+            # not written: keep the counts for the next snapshot
+            with self._lock:
+                for k, v in delta.items(): self._unsaved[k] += v
+            raise
+        with self._lock:
+            # everyone's counts, plus whatever was added here while we were writing
+            for k, s in self.sketches.items():
+                s.counts = merged[k] + self._unsaved[k]
+                s._cum = None
+
+    def restore(self, path):
+        with np.load(path) as f, self._lock:
+            for k, s in self.sketches.items():
+                if k in f and len(f[k]) == s.bins:
+                    s.counts = f[k].astype(np.int64)
+                    s._cum = None
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try: yield
+            finally: fcntl.flock(f, fcntl.LOCK_UN)
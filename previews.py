@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from geometry import L
+from upload_store import UploadStore
+
+# points labelled on the overlay
+LABELS = {"eyeL": "L Eye", "eyeR": "R Eye", "nose": "Nose", "lipM": "Lips", "chin": "Chin"}
+
+
+class Previews:
+    # downscaled previews and landmark overlays for the result page, rendered on first
+    # request and kept on disk by content hash. overlays reuse the landmarks from the
+    # analysis (remembered here or found in the landmark store) instead of re-running FaceMesh.
+    # the files live in an UploadStore, so they get the same byte budget and lru eviction
+    def __init__(self, root, source, store=None, side=640, keep=512, max_bytes=256 << 20):
+        self.files = UploadStore(root, max_bytes)
+        self.source = source  # image hash -> original bytes, None if unknown
+        self.store = store
+        self.side = side
+        self.keep = keep
+        self._landmarks = OrderedDict()
+        self._lock = threading.Lock()
+        self._rendering = {}
+
+    def remember(self, image_hash, pts, w, h):
+        with self._lock:
+            self._landmarks[image_hash] = (pts, w, h)
+            self._landmarks.move_to_end(image_hash)
+            while len(self._landmarks) > self.keep: self._landmarks.popitem(last=False)
+
+    def landmarks(self, image_hash):
+        with self._lock: found = self._landmarks.get(image_hash)
+        if found is None and self.store is not None: found = self.store.get(image_hash)
+        return found
+
+    def has_overlay(self, image_hash):
+        # an overlay is already rendered or can be: without landmarks (a cached result after a
+        # restart, say) there's nothing to draw, and a bare thumb must not be kept as the overlay
+        return self.files.get(f"{image_hash}_overlay") is not None or self.landmarks(image_hash) is not None
+
+    def path(self, image_hash, kind):
+        # rendered file for kind "thumb" or "overlay", None if the original or, for an
+        # overlay, the landmarks aren't available
+        key = f"{image_hash}_{kind}"
+        out = self.files.get(key)
+        if out is not None: return out
+        with self._lock: lock = self._rendering.setdefault(key, threading.Lock())
+        try:
+            with lock:  # two requests for the same new preview render it once
+                out = self.files.get(key)
+                if out is not None: return out
+                found = None
+                if kind == "overlay":
+                    found = self.landmarks(image_hash)
+                    if found is None: return None
+                data = self.source(image_hash)
+                if data is None: return None
+                jpeg = self._render(data, found)
+                return self.files.put(key, jpeg) if jpeg is not None else None
+        finally:
+            with self._lock: self._rendering.pop(key, None)
+
+    def _render(self, data, found):
+        # jpeg bytes of the preview, None if the image can't be decoded
+        import cv2
+        from face_analyzer import AnalysisError, load_image
+        try: img, w, h = load_image(data, self.side)
+        except AnalysisError: return None  # over the ingest budget
+        if img is None: return None
+        if found is not None:
+            pts, _, _ = found
+            s = img.shape[1] / w
+            _draw(img, np.asarray(pts)[..., :2] * s)
+        return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+
+def _draw(img, faces):
+    import cv2
+    import mediapipe as mp
+    for pts in faces.astype(int):
+        for a, b in mp.solutions.face_mesh.FACEMESH_CONTOURS:
+            cv2.line(img, tuple(pts[a]), tuple(pts[b]), (0, 255, 0), 1, cv2.LINE_AA)
+        for name, i in L.items():
+            cv2.circle(img, tuple(pts[i]), 3, (255, 0, 0), cv2.FILLED)
+            if name in LABELS:
+                cv2.putText(img, LABELS[name], (pts[i][0] + 6, pts[i][1] - 6),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1, cv2.LINE_AA)
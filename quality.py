@@ -0,0 +1,51 @@
+import os
+from dataclasses import asdict, dataclass
+
+import numpy as np
+
+
+@dataclass(slots=True)
+class QualityConfig:
+    mode: str = "reject"        # reject, flag (count only) or off
+    min_side: int = 128         # shortest side of the original, px
+    max_aspect: float = 3.0     # long side / short side
+    min_sharpness: float = 10.0 # laplacian variance on the small copy
+    min_brightness: float = 35.0
+    max_brightness: float = 220.0
+    max_clipped: float = 0.6    # share of pixels crushed to black or blown to white
+    side: int = 128             # long side of the copy the checks run on
+
+    @classmethod
+    def from_env(cls):
+        # EROS_QUALITY=<mode>, EROS_QUALITY_<FIELD>=<value> for the thresholds
+        # (slotted dataclass: the class attributes are descriptors, so defaults come from cls())
+        c = cls()
+        c.mode = os.environ.get("EROS_QUALITY", c.mode)
+        for name, value in asdict(c).items():
+            env = os.environ.get(f"EROS_QUALITY_{name.upper()}")
+            if env is not None and name != "mode": setattr(c, name, type(value)(env))
+        return c
+
+    def to_dict(self): return asdict(self)
+
+
+def check(img, w, h, cfg: QualityConfig) -> list[str]:
+    # problems that make an image not worth running FaceMesh on, [] if it looks fine.
+    # img is the decoded BGR frame, w/h the original size; takes a few ms at most
+    import cv2
+    if min(w, h) < cfg.min_side: return ["Image too small."]
+    if max(w, h) / max(1, min(w, h)) > cfg.max_aspect: return ["Image aspect ratio too extreme."]
+
+    ih, iw = img.shape[:2]
+    s = min(1.0, cfg.side / max(ih, iw))
+    small = cv2.resize(img, (max(1, round(iw*s)), max(1, round(ih*s))), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    hist = np.bincount(gray.ravel(), minlength=256)
+    n = gray.size
+    issues = []
+    mean = float(hist @ np.arange(256)) / n
+    if mean < cfg.min_brightness: issues.append("Image too dark.")
+    elif mean > cfg.max_brightness: issues.append("Image too bright.")
+    if (hist[:6].sum() + hist[250:].sum()) / n > cfg.max_clipped: issues.append("Image badly exposed.")
+    if cv2.Laplacian(gray, cv2.CV_64F).var() < cfg.min_sharpness: issues.append("Image too blurry.")
+    return issues
@@ -0,0 +1,55 @@
+# re-score every face in a landmark store without running FaceMesh again, with one or
+# more scoring profiles side by side:
+#   python rescore.py store/ --profile brutal --profile softer.json -o scores.npz
+
+import argparse
+import time
+
+import numpy as np
+
+from geometry import DEFAULT_PROFILE, FACE_PROFILE, Profile, apply_profile
+from landmark_store import LandmarkStore
+
+
+def rescore(store, profiles, chunk=100_000):
+    # {profile name: (N,) totals} over the whole store, a chunk of rows at a time
+    hashes, faces, widths, heights = store.index()
+    pts = store.array(len(hashes))
+    out = {p.name: np.empty(len(hashes)) for p in profiles}
+    for start in range(0, len(hashes), chunk):
+        batch = np.asarray(pts[start:start + chunk])
+        for p in profiles:
+            out[p.name][start:start + chunk] = apply_profile(p, batch, widths[start:start + chunk])["total"]
+    return hashes, faces, out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Score stored landmarks with one or more scoring profiles.")
+    ap.add_argument("store", help="landmark store folder")
+    ap.add_argument("--profile", action="append", default=[],
+                    help="profile json, or 'brutal' / 'brutal-face' for the built-in ones (repeat to compare)")
+    ap.add_argument("--chunk", type=int, default=100_000, help="faces scored per vectorized pass")
+    ap.add_argument("-o", "--out", help="save per-face totals for every profile as .npz")
+    args = ap.parse_args(argv)
+
+    builtin = {p.name: p for p in (DEFAULT_PROFILE, FACE_PROFILE)}
+    profiles = [builtin[p] if p in builtin else Profile.load(p) for p in args.profile or ["brutal"]]
+    store = LandmarkStore(args.store)
+    start = time.perf_counter()
+    hashes, faces, totals = rescore(store, profiles, args.chunk)
+    elapsed = time.perf_counter() - start
+    print(f"{len(hashes)} faces x {len(profiles)} profiles in {elapsed:.2f}s")
+
+    base = profiles[0].name
+    for name, t in totals.items():
+        if not len(t): continue
+        line = f"{name:<16} mean {t.mean():6.1f}  p10 {np.percentile(t, 10):6.1f}  p50 {np.median(t):6.1f}  p90 {np.percentile(t, 90):6.1f}"
+        if name != base and len(t) > 1:
+            line += f"  vs {base}: mean diff {np.mean(t - totals[base]):+.1f}, corr {np.corrcoef(t, totals[base])[0, 1]:.3f}"
+        print(line)
+    if args.out:
+        np.savez(args.out, hashes=np.array(hashes), faces=faces, **totals)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# "faces with geometry like yours": landmarks normalized for position and scale, reduced
+# with PCA and searched with a KD-tree
+#   python similar.py build store/ geometry_index.npz
+#   python similar.py query geometry_index.npz photo.jpg
+
+import argparse
+import heapq
+import os
+import threading
+
+import numpy as np
+
+from geometry import L
+
+
+def normalize(pts):
+    # (N, 478, 3) pixel landmarks -> (N, 956): x/y relative to the midpoint between the
+    # eyes, in units of face width (the same anchors the score uses)
+    pts = np.asarray(pts, np.float32).reshape(-1, pts.shape[-2], 3)[..., :2]
+    center = (pts[:, L["eyeL"]] + pts[:, L["eyeR"]]) / 2
+    width = np.linalg.norm(pts[:, L["right"]] - pts[:, L["left"]], axis=-1)
+    return ((pts - center[:, None]) / width[:, None, None]).reshape(len(pts), -1)
+
+
+class KDTree:
+    # static tree over (N, D) points: median splits on the widest dimension, small leaves
+    # searched by brute force
+    def __init__(self, data, leaf_size=32):
+        self.data = np.asarray(data, np.float32)
+        self.leaf_size = leaf_size
+        self.idx = np.arange(len(self.data))
+        self.nodes = []  # (start, end, dim, split, left, right); dim -1 for leaves
+        if len(self.data): self._build(0, len(self.data))
+
+    def _build(self, start, end):
+        node = len(self.nodes)
+        self.nodes.append(None)
+        if end - start <= self.leaf_size:
+            self.nodes[node] = (start, end, -1, 0.0, -1, -1)
+            return node
+        pts = self.data[self.idx[start:end]]
+        dim = int(np.argmax(pts.max(0) - pts.min(0)))
+        mid = (start + end) // 2
+        self.idx[start:end] = self.idx[start:end][np.argpartition(pts[:, dim], mid - start)]
+        split = float(self.data[self.idx[mid], dim])
+        left = self._build(start, mid)
+        right = self._build(mid, end)
+        self.nodes[node] = (start, end, dim, split, left, right)
+        return node
+
+    def query(self, q, k):
+        # [(squared distance, row)] of the k nearest rows, nearest first
+        best = []   # max-heap of (-d2, row)
+        todo = [(0.0, 0)] if self.nodes else []  # min-heap of (lower bound d2, node)
+        while todo:
+            bound, node = heapq.heappop(todo)
+            if len(best) == k and bound >= -best[0][0]: break
+            start, end, dim, split, left, right = self.nodes[node]
+            if dim < 0:
+                rows = self.idx[start:end]
+                for row, d2 in zip(rows, ((self.data[rows] - q) ** 2).sum(1)):
+                    if len(best) < k: heapq.heappush(best, (-d2, row))
+                    elif d2 < -best[0][0]: heapq.heapreplace(best, (-d2, row))
+                continue
+            diff = q[dim] - split
+            near, far = (left, right) if diff < 0 else (right, left)
+            heapq.heappush(todo, (bound, near))
+            heapq.heappush(todo, (max(bound, float(diff * diff)), far))
+        return sorted((-d2, int(row)) for d2, row in best)
+
+
+class GeometryIndex:
+    # PCA projection + KD-tree. new faces go to a small tail that's searched by brute
+    # force until it's big enough to be worth rebuilding the tree; the rebuild runs on a
+    # background thread while queries keep using the old tree plus the tail
+    def __init__(self, mean, components, vectors=None, ids=None):
+        self.mean, self.components = mean, components
+        self.vectors = np.empty((0, len(components)), np.float32) if vectors is None else vectors
+        self.ids = [] if ids is None else list(ids)
+        self._known = set(self.ids)
+        self._lock = threading.Lock()
+        self._rebuilding = None
+        self._tree = KDTree(self.vectors)
+        self._tree_size = len(self.vectors)
+
+    @classmethod
+    def fit(cls, ids, pts, dims=16, sample=50_000, chunk=10_000):
+        # pts can be a landmark store's memmap: the PCA is fitted on a sample and the
+        # projection done a chunk at a time, so only a chunk of rows is in memory at once
+        rows = np.sort(np.random.default_rng(0).choice(len(pts), min(sample, len(pts)), replace=False))
+        fit_on = normalize(pts[rows])
+        mean = fit_on.mean(0)
+        _, _, vt = np.linalg.svd(fit_on - mean, full_matrices=False)
+        del fit_on
+        mean, components = mean.astype(np.float32), vt[:dims].astype(np.float32)
+        index = cls(mean, components)
+        vectors = np.concatenate([index.project(pts[i:i + chunk]) for i in range(0, len(pts), chunk)]
+                                 or [np.empty((0, len(components)), np.float32)])
+        return cls(mean, components, vectors, list(ids))
+
+    def project(self, pts):
+        return ((normalize(pts) - self.mean) @ self.components.T).astype(np.float32)
+
+    def add(self, ids, pts):
+        # ids already in the index are skipped
+        keep = [i for i, face_id in enumerate(ids) if face_id not in self._known]
+        if not keep: return
+        vectors = self.project(np.asarray(pts)[keep])
+        with self._lock:
+            self.vectors = np.concatenate([self.vectors, vectors])
+            self.ids.extend(ids[i] for i in keep)
+            self._known.update(ids[i] for i in keep)
+            if self._rebuilding is None and len(self.vectors) - self._tree_size > max(1024, self._tree_size // 10):
+                self._rebuilding = threading.Thread(target=self._rebuild, args=(self.vectors,), daemon=True)
+                self._rebuilding.start()
+
+    def _rebuild(self, vectors):
+        # vectors is only ever replaced, never written to, so it's safe to build from unlocked
+        try:
+            tree = KDTree(vectors)
+            with self._lock: self._tree, self._tree_size = tree, len(vectors)
+        finally:
+            with self._lock: self._rebuilding = None
+
+    def query(self, pts, k=5):
+        # [(id, distance)] for the k most similar stored faces to one face
+        q = self.project(pts)[0]
+        with self._lock: tree, vectors, size = self._tree, self.vectors, self._tree_size
+        found = tree.query(q, k)
+        tail = vectors[size:]
+        if len(tail):
+            d2 = ((tail - q) ** 2).sum(1)
+            found += [(float(d), size + int(i)) for i, d in enumerate(d2)]
+            found = sorted(found)[:k]
+        return [(self.ids[row], float(np.sqrt(d2))) for d2, row in found]
+
+    def __len__(self): return len(self.ids)
+
+    def save(self, path):
+        tmp = f"{path}.tmp.npz"
+        with self._lock: vectors, ids = self.vectors, list(self.ids)
+        np.savez(tmp, mean=self.mean, components=self.components, vectors=vectors, ids=np.array(ids))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f["mean"], f["components"], f["vectors"], f["ids"].tolist())
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Build or query the face-geometry similarity index.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="index every face in a landmark store")
+    b.add_argument("store")
+    b.add_argument("index")
+    b.add_argument("--dims", type=int, default=16, help="PCA components to keep")
+    q = sub.add_parser("query", help="find the stored faces most like the one in an image")
+    q.add_argument("index")
+    q.add_argument("image")
+    q.add_argument("-k", type=int, default=5)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "build":
+        from landmark_store import LandmarkStore
+        store = LandmarkStore(args.store)
+        hashes, faces, _, _ = store.index()
+        index = GeometryIndex.fit([f"{h}:{f}" for h, f in zip(hashes, faces)], store.array(len(hashes)), args.dims)
+        index.save(args.index)
+        print(f"indexed {len(index)} faces")
+    else:
+        from face_analyzer import detect
+        with open(args.image, "rb") as f: pts, _, _ = detect(f.read())
+        for face_id, d in GeometryIndex.load(args.index).query(pts[:1], args.k):
+            print(f"{d:.4f}  {face_id}")
+
+
+if __name__ == "__main__":
+    main()
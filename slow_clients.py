@@ -0,0 +1,83 @@
+# shows what slow uploaders do to everyone else. opens --slow connections that trickle an
+# upload over --trickle seconds, and meanwhile times normal uploads from one fast client.
+# run it against each serving mode and compare:
+#   python app.py                 (or gunicorn app:app)
+#   python slow_clients.py
+#   python app.py --asgi
+#   python slow_clients.py
+
+import argparse
+import asyncio
+import glob
+import time
+import uuid
+from urllib.parse import urlparse
+
+
+def multipart(data, field="image", name="face.jpg"):
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{name}\"\r\n"
+            f"Content-Type: image/jpeg\r\n\r\n").encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+async def post(host, port, path, data, trickle=0.0):
+    # one POST over a raw connection; with trickle the body is dribbled out over that many seconds
+    body, ctype = multipart(data)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write((f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: {ctype}\r\n"
+                      f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode())
+        if trickle:
+            chunks = 50
+            step = len(body) // chunks + 1
+            for i in range(0, len(body), step):
+                writer.write(body[i:i + step])
+                await writer.drain()
+                await asyncio.sleep(trickle / chunks)
+        else:
+            writer.write(body)
+        await writer.drain()
+        status = (await reader.readline()).split()
+        await reader.read()
+        return int(status[1]) if len(status) > 1 else 0
+    finally:
+        writer.close()
+
+async def run(url, image, slow, trickle, fast):
+    u = urlparse(url)
+    host, port, path = u.hostname, u.port or 80, u.path or "/"
+    data = open(image, "rb").read()
+
+    async def slow_one():
+        try: return await post(host, port, path, data, trickle)
+        except OSError: return 0
+    slow_tasks = [asyncio.create_task(slow_one()) for _ in range(slow)]
+    await asyncio.sleep(0.5)  # let the slow uploads occupy the server first
+
+    latencies, errors = [], 0
+    for _ in range(fast):
+        start = time.perf_counter()
+        try: ok = await asyncio.wait_for(post(host, port, path, data), timeout=trickle + 30) == 200
+        except (OSError, asyncio.TimeoutError): ok = False
+        latencies.append(time.perf_counter() - start)
+        errors += not ok
+    slow_ok = sum(s == 200 for s in await asyncio.gather(*slow_tasks))
+    latencies.sort()
+    print(f"{slow} slow uploads ({trickle:.0f}s each): {slow_ok} succeeded")
+    print(f"fast uploads meanwhile: {fast - errors}/{fast} ok, "
+          f"median {latencies[len(latencies) // 2] * 1000:.0f} ms, worst {latencies[-1] * 1000:.0f} ms")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Slow-client load test for the serving modes.")
+    ap.add_argument("--url", default="http://127.0.0.1:5000/api/analyze")
+    ap.add_argument("--image", default=(sorted(glob.glob("test_programs/examples/*.jpg")) or [None])[0])
+    ap.add_argument("--slow", type=int, default=200, help="concurrent slow uploads")
+    ap.add_argument("--trickle", type=float, default=20, help="seconds each slow upload takes")
+    ap.add_argument("--fast", type=int, default=20, help="normal uploads timed while they run")
+    args = ap.parse_args(argv)
+    asyncio.run(run(args.url, args.image, args.slow, args.trickle, args.fast))
+
+
+if __name__ == "__main__":
+    main()
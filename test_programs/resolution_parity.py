@@ -0,0 +1,47 @@
+# checking that the capped-resolution decode and the detector cascade give the same scores
+# as a full-size run
+# run from the repo root: python test_programs/resolution_parity.py
+# exits non-zero if a face is found in one run but not the other, or if the overall score
+# moves by more than the run's tolerance (see MAX_SIDE and CASCADE in face_analyzer.py)
+
+import glob
+import sys
+from pathlib import Path
+
+sys.path.insert(0, ".")
+from face_analyzer import AnalysisError, _detect, score_landmarks
+
+# name -> (max_side, cascade, allowed change of the overall score out of 100 against the
+# full-size, single-stage run)
+RUNS = {
+    "max_side 1280": (1280, False, 2.0),
+    "max_side 640": (640, False, 3.0),
+    "cascade": (0, True, 5.0),
+}
+
+def total(data, max_side, cascade):
+    try: return score_landmarks(*_detect(data, max_side, 1, cascade))[0].total
+    except AnalysisError: return None
+
+images = sorted(glob.glob("static/uploads/*.jpg") + glob.glob("test_programs/examples/*.jpg"))
+worst = {name: 0.0 for name in RUNS}
+failures = []
+
+for img in images:
+    data = Path(img).read_bytes()
+    full = total(data, 0, False)
+    for name, (side, cascade, tol) in RUNS.items():
+        other = total(data, side, cascade)
+        if (full is None) != (other is None):
+            failures.append(f"{img} @ {name}: face found in one run but not the other")
+            continue
+        if full is None: continue
+        diff = abs(full - other)
+        worst[name] = max(worst[name], diff)
+        print(f"{img} @ {name}: total {full:.1f} vs {other:.1f} (diff {diff:.2f})")
+        if diff > tol: failures.append(f"{img} @ {name}: total off by {diff:.2f} (tolerance {tol})")
+
+for name, (_, _, tol) in RUNS.items():
+    print(f"worst total diff @ {name}: {worst[name]:.2f} (tolerance {tol})")
+for f in failures: print("FAIL", f)
+sys.exit(1 if failures else 0)
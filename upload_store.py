@@ -0,0 +1,77 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# file extension from the first bytes, so the stored name doesn't depend on what the client called it
+_MAGIC = [(b"\xff\xd8", ".jpg"), (b"\x89PNG", ".png"), (b"GIF8", ".gif"), (b"BM", ".bmp"),
+          (b"II*\x00", ".tif"), (b"MM\x00*", ".tif")]
+
+def _ext(data):
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP": return ".webp"
+    return next((ext for magic, ext in _MAGIC if data.startswith(magic)), ".bin")
+
+
+class UploadStore:
+    # uploads named by content hash, so the same image is kept once whatever it was called.
+    # a sqlite index tracks size and last access; past max_bytes the least recently used
+    # files go first, and anything untouched for ttl seconds goes regardless. files are
+    # written to a temp name and renamed into place, so concurrent writers of the same
+    # image (threads or processes) can't leave a torn file
+    def __init__(self, root, max_bytes=1 << 30, ttl=None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes, self.ttl = max_bytes, ttl
+        self._db = sqlite3.connect(str(self.root / ".index.sqlite"), timeout=30,
+                                   check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS files (hash TEXT PRIMARY KEY, name TEXT, size INTEGER, atime REAL)")
+        self._lock = threading.Lock()
+
+    def put(self, image_hash, data) -> Path:
+        with self._lock:
+            row = self._db.execute("SELECT name FROM files WHERE hash = ?", (image_hash,)).fetchone()
+        name = row[0] if row else image_hash + _ext(data)
+        path = self.root / name
+        if not path.exists():
+            tmp = self.root / f".{name}.{os.getpid()}.{threading.get_ident()}.tmp"
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (image_hash, name, len(data), time.time()))
+        self.evict()
+        return path
+
+    def get(self, image_hash):
+        # path of a stored upload (and marks it used), None if it's not here
+        with self._lock:
+            row = self._db.execute("SELECT name FROM files WHERE hash = ?", (image_hash,)).fetchone()
+            if row is None: return None
+            self._db.execute("UPDATE files SET atime = ? WHERE hash = ?", (time.time(), image_hash))
+        path = self.root / row[0]
+        return path if path.exists() else None
+
+    def total_bytes(self):
+        with self._lock: return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+
+    def evict(self):
+        with self._lock:
+            doomed = []
+            if self.ttl:
+                doomed += self._db.execute("SELECT hash, name, size FROM files WHERE atime < ?",
+                                           (time.time() - self.ttl,)).fetchall()
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+            total -= sum(r[2] for r in doomed)
+            if total > self.max_bytes:
+                gone = {r[0] for r in doomed}
+                for r in self._db.execute("SELECT hash, name, size FROM files ORDER BY atime"):
+                    if total <= self.max_bytes: break
+                    if r[0] in gone: continue
+                    doomed.append(r)
+                    total -= r[2]
+            if not doomed: return
+            self._db.executemany("DELETE FROM files WHERE hash = ?", [(r[0],) for r in doomed])
+        for _, name, _ in doomed:
+            try: (self.root / name).unlink()
+            except FileNotFoundError: pass
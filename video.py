@@ -0,0 +1,147 @@
+# offline scoring for recorded videos: python video.py clip.mp4 --stride 5 -o frames.jsonl
+# decode, inference and aggregation run in their own threads joined by bounded queues,
+# so the next frames are decoded while the current one is in FaceMesh
+
+import argparse
+import json
+import queue
+import sys
+import threading
+from collections import deque
+
+import numpy as np
+
+from geometry import landmarks_array, score_faces
+
+_DONE = object()
+
+
+def _put(q, item, stop):
+    # put that gives up once stop is set, so a stage never hangs on a queue nobody drains
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _get(q, stop):
+    while not stop.is_set():
+        try: return q.get(timeout=0.1)
+        except queue.Empty: pass
+    return _DONE
+
+def _decode(path, stride, out, stop):
+    import cv2
+    cap = cv2.VideoCapture(str(path))
+    try:
+        if not cap.isOpened(): raise IOError(f"Could not open {path}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        i = 0
+        while not stop.is_set():
+            # grab() skips the pixel conversion for frames the stride drops
+            if i % stride:
+                if not cap.grab(): break
+            else:
+                ok, frame = cap.read()
+                if not ok: break
+                if not _put(out, (i, i / fps, frame), stop): break
+            i += 1
+    except Exception as e:
+        _put(out, e, stop)
+    finally:
+        cap.release()
+        _put(out, _DONE, stop)
+
+def _infer(inp, out, max_side, tracking, stop):
+    try:
+        import cv2
+        import mediapipe as mp
+        mesh = mp.solutions.face_mesh.FaceMesh(
+            static_image_mode=not tracking, max_num_faces=1,
+            refine_landmarks=True, min_detection_confidence=0.7,
+        )
+        while True:
+            item = _get(inp, stop)
+            if item is _DONE or isinstance(item, Exception):
+                _put(out, item, stop)
+                if item is _DONE: return
+                continue
+            i, t, frame = item
+            h, w = frame.shape[:2]
+            if max_side and max(h, w) > max_side:
+                s = max_side / max(h, w)
+                frame = cv2.resize(frame, (round(w*s), round(h*s)), interpolation=cv2.INTER_AREA)
+            res = mesh.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            m = None
+            if res.multi_face_landmarks:
+                m = {k: float(v) for k, v in score_faces(landmarks_array(res.multi_face_landmarks[0], w, h), w).items()}
+            if not _put(out, (i, t, m), stop): return
+    except Exception as e:
+        # score_video raises the first exception it gets, so it never waits on a dead thread
+        _put(out, e, stop)
+
+
+def score_video(path, stride=1, max_side=1280, window=9, on_frame=None):
+    # returns (per-frame rows, summary). rows carry the frame index, timestamp, the metrics
+    # (None without a face) and a rolling median of the total over `window` scored frames
+    frames, results = queue.Queue(maxsize=16), queue.Queue(maxsize=16)
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=_decode, args=(path, stride, frames, stop), daemon=True),
+        # with a stride the frames are too far apart for tracking to help
+        threading.Thread(target=_infer, args=(frames, results, max_side, stride == 1, stop), daemon=True),
+    ]
+    for t in threads: t.start()
+
+    rows, recent = [], deque(maxlen=window)
+    try:
+        while True:
+            item = results.get()
+            if item is _DONE: break
+            if isinstance(item, Exception): raise item
+            i, t, m = item
+            row = {"frame": i, "time": round(t, 3), "metrics": m}
+            if m:
+                recent.append(m["total"])
+                row["total_smooth"] = float(np.median(recent))
+            rows.append(row)
+            if on_frame: on_frame(row)
+    finally:
+        # on an error (ours, a stage's or on_frame's) the stages see stop and wind down,
+        # releasing the capture, instead of blocking on full queues forever
+        stop.set()
+        for t in threads: t.join()
+    return rows, summarize(rows)
+
+def summarize(rows):
+    scored = [r for r in rows if r["metrics"]]
+    summary = {"frames": len(rows), "frames_with_face": len(scored)}
+    if not scored: return summary
+    keys = scored[0]["metrics"].keys()
+    summary["median"] = {k: float(np.median([r["metrics"][k] for r in scored])) for k in keys}
+    best = max(scored, key=lambda r: r["metrics"]["total"])
+    summary["best"] = {"frame": best["frame"], "time": best["time"], **best["metrics"]}
+    return summary
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Score every (n-th) frame of a video.")
+    ap.add_argument("video")
+    ap.add_argument("--stride", type=int, default=1, help="score every n-th frame")
+    ap.add_argument("--max-side", type=int, default=1280, help="longest side fed to FaceMesh (0 = full size)")
+    ap.add_argument("-o", "--out", help="write the per-frame time series here as jsonl")
+    args = ap.parse_args(argv)
+
+    out = open(args.out, "w") if args.out else None
+    write = (lambda row: out.write(json.dumps(row) + "\n")) if out else None
+    try: _, summary = score_video(args.video, max(1, args.stride), args.max_side, on_frame=write)
+    finally:
+        if out: out.close()
+    json.dump(summary, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()